@@ -11,13 +11,28 @@ GSR sensor:
 
 OUTPUT:
   Timestamp,Red,IR,GSR
+  or, with BINARY_PROTOCOL set to 1, 19 byte little-endian frames:
+  sync (A5 5A) | sequence u16 | millis u32 | red u32 | ir u32 | gsr u16 | checksum u8
+  The checksum is the low byte of the sum of the bytes from sequence to gsr.
 */
 
 #include <Wire.h>
 #include "MAX30105.h"
 
+#define BINARY_PROTOCOL 0
+
 MAX30105 particleSensor;
 
+struct __attribute__((packed)) Frame {
+  uint16_t sync;
+  uint16_t sequence;
+  uint32_t timestamp;
+  uint32_t red;
+  uint32_t ir;
+  uint16_t gsr;
+  uint8_t checksum;
+};
+
 void setup() {
   Serial.begin(230400); 
 
@@ -36,6 +51,26 @@ void setup() {
   particleSensor.setup(ledBrightness, sampleAverage, ledMode, sampleRate, pulseWidth, adcRange); // Configure sensor with these settings
 }
 void loop() {
+#if BINARY_PROTOCOL
+  // Send raw data as checksummed frames, the host resyncs on the sync word
+  Frame frame;
+  frame.sync = 0x5AA5;
+  frame.sequence = 0;
+  do {
+      frame.timestamp = millis();
+      frame.red = particleSensor.getRed();
+      frame.ir = particleSensor.getIR();
+      frame.gsr = analogRead(A0);
+      uint8_t *bytes = (uint8_t *)&frame;
+      uint8_t checksum = 0;
+      for (uint8_t i = 2; i < sizeof(Frame) - 1; i++) {
+        checksum += bytes[i];
+      }
+      frame.checksum = checksum;
+      Serial.write(bytes, sizeof(Frame));
+      frame.sequence++;
+  }while (true);
+#else
   // Read samples and print raw data in CSV format
   do {
       Serial.print(millis());
@@ -46,4 +81,5 @@ void loop() {
       Serial.print(",");
       Serial.println(analogRead(A0));
   }while (true);
+#endif
 }
@@ -1,8 +1,9 @@
 import os
+import random
 from datetime import datetime
 
 import pandas as pd
-from PySide6.QtCore import Qt, QTimer
+from PySide6.QtCore import Qt, QThread, QTimer, Signal
 from PySide6.QtWidgets import (
     QApplication,
     QDialog,
@@ -13,18 +14,34 @@ from PySide6.QtWidgets import (
     QPushButton,
     QWidget,
 )
-from sklearn.model_selection import train_test_split
 
 from lie_detector.connect import DataRecorder
-from lie_detector.constants import QUESTIONS_PATH
-from lie_detector.data_preprocessing.process_signals import process_signal
-from lie_detector.predictor.predictor import LieDetectorModel
+from lie_detector.constants import (
+    CONTINUOUS_SESSION,
+    DATASET_CACHE_DIR,
+    INFERENCE_WEIGHTS_PATH,
+    PIPELINE_MAX_PENDING,
+    PIPELINE_WORKERS,
+    PREDICTION_SERVER_URL,
+    QUESTIONS_PATH,
+    RECORDING_FORMAT,
+    SESSION_DB_PATH,
+    STREAMING_FEATURES,
+    TRAINING_WINDOWS,
+)
+from lie_detector.data_preprocessing.constants import END_TIME, START_TIME
+from lie_detector.data_preprocessing.process_signals import process_signal, save_features
+from lie_detector.data_preprocessing.streaming import StreamingSignalProcessor
+from lie_detector.instrumentation import metrics, span, timed
+from lie_detector.pipeline import AnswerJob, AnswerPipeline
+from lie_detector.predictor.predictor import LieDetectorModel, epoch_progress_callback
+from lie_detector.predictor.server import PredictionClient
+from lie_detector.recording_format import read_features
+from lie_detector.session_store import SessionStore
 
 
-def get_random_question(filenames=QUESTIONS_PATH):
-    df = pd.read_csv(filenames, delimiter=";")
-    random_question = str(df.sample(n=1)["question"].values[0])
-    return random_question
+def load_questions(filename=QUESTIONS_PATH):
+    return pd.read_csv(filename, delimiter=";")["question"].astype(str).tolist()
 
 
 def save_answer(question, answer, Truth, filename):
@@ -35,6 +52,66 @@ def save_answer(question, answer, Truth, filename):
         df.to_csv(filename, mode="w", header=True, index=False)
 
 
+def train_model(lie_detector, model_path, report=print, windows=TRAINING_WINDOWS):
+    # TensorFlow (through the input pipeline and the model) is only imported
+    # once training actually starts
+    from lie_detector.predictor.input_pipeline import make_datasets, make_window_datasets
+
+    report("Loading training data...")
+    # Windows are streamed from disk, only the labels are read up front
+    if windows:
+        # Overlapping windows of the raw recordings, their features cached next to the dataset
+        cache_dir = os.path.join(lie_detector.cache_dir, "windows") if lie_detector.cache_dir else None
+        datasets = make_window_datasets(lie_detector.labelled_recordings(raw=True), batch_size=32, cache_dir=cache_dir)
+    else:
+        datasets = make_datasets(lie_detector.labelled_recordings(), batch_size=32)
+    train, validation, num_train, num_validation = datasets
+    report(f"Training model on {num_train} windows ({num_validation} for validation)...")
+    lie_detector.train_dataset(train, validation, epochs=10, callbacks=[epoch_progress_callback(report)])
+    lie_detector.save_model(model_path)
+
+
+class ModelLoader(QThread):
+    # Loads the saved model, or trains a new one, without blocking the GUI
+    progress = Signal(str)
+    loaded = Signal()
+    failed = Signal(str)
+
+    def __init__(self, lie_detector, model_path, inference_weights_path=None):
+        super().__init__()
+        self.lie_detector = lie_detector
+        self.model_path = model_path
+        self.inference_weights_path = inference_weights_path or os.path.splitext(model_path)[0] + ".npz"
+
+    def inference_weights_current(self):
+        if not os.path.exists(self.inference_weights_path):
+            return False
+        if not os.path.exists(self.model_path):
+            return True
+        return os.path.getmtime(self.inference_weights_path) >= os.path.getmtime(self.model_path)
+
+    @timed("model_loader")
+    def run(self):
+        try:
+            weights_path = self.inference_weights_path
+            if self.inference_weights_current():
+                # Frozen weights load in milliseconds and do not need TensorFlow
+                self.progress.emit("Loading model...")
+                self.lie_detector.load_inference_weights(weights_path)
+            else:
+                if os.path.exists(self.model_path):
+                    self.progress.emit("Loading model...")
+                    self.lie_detector.load_model(self.model_path)
+                else:
+                    train_model(self.lie_detector, self.model_path, report=self.progress.emit)
+                self.lie_detector.export_inference_weights(weights_path)
+                self.lie_detector.load_inference_weights(weights_path)
+        except Exception as e:
+            self.failed.emit(f"{type(e).__name__}: {e}")
+        else:
+            self.loaded.emit()
+
+
 class TruthLieDialog(QDialog):
     def __init__(self, question, answer, parent=None):
         super().__init__(parent)
@@ -58,23 +135,22 @@ class TruthLieDialog(QDialog):
         return self.exec_() == QDialog.Accepted
 
 
-class PredictionResultDialog(QDialog):
-    def __init__(self, prediction, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Prediction Result")
-
-        layout = QGridLayout(self)
-        label = QLabel(f"The prediction is: {prediction}")
-        layout.addWidget(label)
-
-        self.buttonBox = QDialogButtonBox(QDialogButtonBox.Ok, self)
-        self.buttonBox.accepted.connect(self.accept)
-
-        layout.addWidget(self.buttonBox)
-
-
 class MainWindowApp(QMainWindow):
-    def __init__(self, serial_port, recordings_dir, recordings_processed_dir, plots_dir, model_path, answers_dir):
+    def __init__(
+        self,
+        serial_port,
+        recordings_dir,
+        recordings_processed_dir,
+        plots_dir,
+        model_path,
+        answers_dir,
+        continuous_session=CONTINUOUS_SESSION,
+        streaming_features=STREAMING_FEATURES,
+        prediction_url=PREDICTION_SERVER_URL,
+        pipeline_workers=PIPELINE_WORKERS,
+        pipeline_max_pending=PIPELINE_MAX_PENDING,
+        session_db_path=SESSION_DB_PATH,
+    ):
         super().__init__()
 
         self.recordings_dir = recordings_dir
@@ -83,15 +159,42 @@ class MainWindowApp(QMainWindow):
         self.serial_port = serial_port
         self.model_path = model_path
         self.answers_dir = answers_dir
-
-        self.lie_detector = LieDetectorModel(self.recordings_processed_dir, self.answers_dir)
-
-        if not os.path.exists(self.model_path):
-            self.train_model()
+        self.continuous_session = continuous_session
+        self.streaming_features = streaming_features
+        self.prediction_client = PredictionClient(prediction_url) if prediction_url else None
+
+        # Answers, recordings and predictions go to the session store when there is
+        # one, otherwise to an answers_<time>.csv file per answer
+        self.session_store = SessionStore(session_db_path) if session_db_path else None
+        self.session_id = None
+        if self.session_store is not None:
+            self.session_id = self.session_store.start_session(
+                serial_port=serial_port, continuous_session=continuous_session, streaming_features=streaming_features
+            )
+            self.questions = self.session_store.question_bank(QUESTIONS_PATH)
         else:
-            self.lie_detector.load_model(self.model_path)
-
-        self.recorder = DataRecorder(self.serial_port)
+            self.questions = load_questions(QUESTIONS_PATH)
+
+        self.lie_detector = LieDetectorModel(
+            self.recordings_processed_dir,
+            self.answers_dir,
+            DATASET_CACHE_DIR,
+            session_store=self.session_store,
+            recordings_directory=self.recordings_dir,
+        )
+        self.model_ready = False
+        # (features path, question, recorded_at) answered before the model finished loading
+        self.pending_predictions = []
+        # Answered windows are processed and predicted off the GUI thread while
+        # the next question is recorded
+        self.pipeline = AnswerPipeline(
+            self.process_answer, self.predict_features, workers=pipeline_workers, max_pending=pipeline_max_pending
+        )
+        self.pipeline.result_ready.connect(self.answer_processed)
+        # Set while the next question waits for the pipeline to catch up
+        self.waiting_for_pipeline = False
+
+        self.recorder = DataRecorder(self.serial_port, batched=True)
 
         self.current_question = None
         self.time_left = 10
@@ -103,11 +206,15 @@ class MainWindowApp(QMainWindow):
 
         self.label = QLabel("Do you want to start")
         self.timer_label = QLabel("Time left: 10s")
+        self.status_label = QLabel("Loading model...")
+        self.prediction_label = QLabel("")
         button1 = QPushButton("Yes")
         button2 = QPushButton("No")
 
         layout.addWidget(self.label, 0, 0)
         layout.addWidget(self.timer_label, 2, 0)
+        layout.addWidget(self.status_label, 3, 0, 1, 2)
+        layout.addWidget(self.prediction_label, 4, 0, 1, 2)
         layout.addWidget(button1, 1, 0)
         layout.addWidget(button2, 1, 1)
 
@@ -119,6 +226,28 @@ class MainWindowApp(QMainWindow):
         self.timer = QTimer()
         self.timer.timeout.connect(self.handle_timeout)
 
+        self.model_loader = None
+        if self.prediction_client is not None:
+            # Client mode: predictions come from a shared prediction server
+            self.model_ready = True
+            self.status_label.setText(f"Using prediction server {self.prediction_client.url}")
+        else:
+            self.model_loader = ModelLoader(self.lie_detector, self.model_path, INFERENCE_WEIGHTS_PATH)
+            self.model_loader.progress.connect(self.status_label.setText)
+            self.model_loader.loaded.connect(self.model_loaded)
+            self.model_loader.failed.connect(self.model_failed)
+            self.model_loader.start()
+
+    def model_loaded(self):
+        self.model_ready = True
+        self.status_label.setText("Model ready")
+        pending, self.pending_predictions = self.pending_predictions, []
+        for data_file, question, recorded_at in pending:
+            self.predict_lie(data_file, question, recorded_at)
+
+    def model_failed(self, error):
+        self.status_label.setText(f"Model unavailable: {error}")
+
     def freeze_window(self):
         QApplication.setOverrideCursor(Qt.WaitCursor)
         QTimer.singleShot(2000, self.unfreeze_window)
@@ -135,7 +264,7 @@ class MainWindowApp(QMainWindow):
             self.new_question()
 
     def new_question(self):
-        self.current_question = get_random_question()
+        self.current_question = random.choice(self.questions)
         self.label.setText(self.current_question)
         self.time_left = 10
         self.timer_label.setText(f"Time left: {self.time_left}s")
@@ -144,26 +273,113 @@ class MainWindowApp(QMainWindow):
         self.filename = os.path.join(self.answers_dir, f"answers_{self.start_time}.csv")
 
         self.timer.start(1000)
-        self.recorder.start_recording()
+        if self.continuous_session:
+            if not self.recorder.session_running:
+                self.recorder.start_session()
+            self.recorder.mark_segment_start()
+            start_time, end_time = 0.0, END_TIME - START_TIME
+        else:
+            self.recorder.start_recording(self.raw_recording_path())
+            start_time, end_time = START_TIME, END_TIME
+        if self.streaming_features:
+            self.recorder.processor = StreamingSignalProcessor(start_time=start_time, end_time=end_time)
 
+    @timed("finish_answer")
     def finish_answer(self, answer):
-        truth = False
         if answer != "No answer":
-            raw_recording_path = os.path.join(self.recordings_dir, f"recording_{self.start_time}.csv")
-            self.recorder.stop_recording_and_save(raw_recording_path)
-            new_path = process_signal(
-                data_path=raw_recording_path, output_dir=self.recordings_processed_dir, plot_dir=self.plots_dir
+            raw_recording_path = self.raw_recording_path()
+            if self.continuous_session:
+                # Segments start at the question, there is no reconnect transient to skip
+                self.recorder.save_segment(raw_recording_path)
+                start_time, end_time = 0.0, END_TIME - START_TIME
+            else:
+                self.recorder.stop_recording_and_save(raw_recording_path)
+                start_time, end_time = START_TIME, END_TIME
+            if self.session_store is not None:
+                self.session_store.save_recording(
+                    self.start_time,
+                    raw_recording_path,
+                    session_id=self.session_id,
+                    metadata=self.recorder.saved_metadata,
+                )
+            # Detached so the chunks arriving during the dialog below do not
+            # update it while a worker reads the features
+            processor, self.recorder.processor = self.recorder.processor, None
+            # Processed while the truth is asked and the next question recorded
+            self.pipeline.submit(
+                AnswerJob(
+                    self.current_question,
+                    answer,
+                    raw_recording_path,
+                    start_time,
+                    end_time,
+                    processor=processor,
+                    recorded_at=self.start_time,
+                )
             )
-            self.predict_lie(new_path)
             dialog = TruthLieDialog(self.current_question, answer)
-            truth = dialog.get_truth_lie()
-            save_answer(self.current_question, answer, "Truth" if truth else "Lie", filename=self.filename)
+            with span("dialog.truth_lie"):
+                truth = dialog.get_truth_lie()
+            self.save_answer(answer, "Truth" if truth else "Lie")
         else:
-            save_answer(self.current_question, answer, "", filename=self.filename)
-
+            self.recorder.discard_recording()
+            self.save_answer(answer, "")
+
+        if self.pipeline.saturated:
+            # Backpressure: the next question starts once a result frees a slot
+            self.waiting_for_pipeline = True
+            self.status_label.setText(f"Processing {self.pipeline.pending} answers...")
+            return
         self.setEnabled(True)
         self.new_question()
 
+    def save_answer(self, answer, truth):
+        if self.session_store is not None:
+            self.session_store.save_answer(
+                self.start_time, self.current_question, answer, truth or None, session_id=self.session_id
+            )
+        else:
+            save_answer(self.current_question, answer, truth, filename=self.filename)
+
+    def process_answer(self, job):
+        # Runs on a pipeline worker
+        output_path = os.path.join(
+            self.recordings_processed_dir,
+            f"{os.path.splitext(os.path.basename(job.raw_recording_path))[0]}_output.{RECORDING_FORMAT}",
+        )
+        if job.processor is not None:
+            # Features were computed while recording, only the output has to be written
+            return save_features(job.processor.features(), output_path)
+        return process_signal(
+            data_path=job.raw_recording_path,
+            output_dir=self.recordings_processed_dir,
+            plot_dir=self.plots_dir,
+            start_time=job.start_time,
+            end_time=job.end_time,
+            background_plot=True,
+        )
+
+    def answer_processed(self, result):
+        # Results arrive in the order the questions were answered
+        job = result.job
+        if self.session_store is not None and result.features_path is not None:
+            self.session_store.save_recording(job.recorded_at, features_path=result.features_path)
+        if result.error is not None:
+            self.status_label.setText(f"Processing '{job.question}' failed: {result.error}")
+        elif result.prediction is None:
+            # The worker may have run before the model was loaded: predicted here
+            # now if it is ready, queued for model_loaded otherwise
+            self.predict_lie(result.features_path, job.question, job.recorded_at)
+        else:
+            self.show_prediction(result.prediction, job.question, job.recorded_at)
+        if self.waiting_for_pipeline and not self.pipeline.saturated:
+            self.waiting_for_pipeline = False
+            self.setEnabled(True)
+            self.new_question()
+
+    def raw_recording_path(self):
+        return os.path.join(self.recordings_dir, f"recording_{self.start_time}.{RECORDING_FORMAT}")
+
     def handle_timeout(self):
         self.time_left -= 1
         self.timer_label.setText(f"Time left: {self.time_left}s")
@@ -172,20 +388,44 @@ class MainWindowApp(QMainWindow):
             self.record_answer("No answer")
 
     def train_model(self):
-        data, labels = self.lie_detector.load_data()
-        X, y = self.lie_detector.preprocess_data(data, labels)
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.1, random_state=42)
-        self.lie_detector.train_model(X_train, y_train, X_test, y_test, epochs=10, batch_size=32)
-        self.lie_detector.save_model(self.model_path)
-
-    def predict_lie(self, data_file):
-        data_df = pd.read_csv(data_file)
-        data = data_df.to_numpy()
-        prediction = self.lie_detector.predict(data)
-        print(prediction[0][0])
-        lie_or_truth = "Lie" if prediction[0][0] < 0.5 else "Truth"
-        self.show_prediction_result(lie_or_truth)
-
-    def show_prediction_result(self, prediction):
-        result_dialog = PredictionResultDialog(prediction, self)
-        result_dialog.exec_()
+        train_model(self.lie_detector, self.model_path)
+
+    def closeEvent(self, event):
+        if self.model_loader is not None:
+            self.model_loader.wait()
+        self.pipeline.close()
+        if self.session_store is not None:
+            self.session_store.close()
+        if self.recorder.session_running:
+            self.recorder.stop_session()
+        metrics.flush()
+        super().closeEvent(event)
+
+    def predict_features(self, data_file):
+        # Thread-safe, None until the model is ready
+        if not self.model_ready:
+            return None
+        data = read_features(data_file)
+        if self.prediction_client is not None:
+            return self.prediction_client.predict(data)
+        return self.lie_detector.predict(data)[0][0]
+
+    @timed("predict_lie")
+    def predict_lie(self, data_file, question=None, recorded_at=None):
+        prediction = self.predict_features(data_file)
+        if prediction is None:
+            self.pending_predictions.append((data_file, question, recorded_at))
+            self.status_label.setText(f"Model not ready yet, {len(self.pending_predictions)} prediction(s) queued")
+            return
+        self.show_prediction(prediction, question, recorded_at)
+
+    def show_prediction(self, prediction, question=None, recorded_at=None):
+        if self.session_store is not None and recorded_at is not None:
+            model = self.prediction_client.url if self.prediction_client is not None else self.model_path
+            self.session_store.save_prediction(recorded_at, prediction, model=model)
+        lie_or_truth = "Lie" if prediction < 0.5 else "Truth"
+        # Shown in the window rather than a modal dialog, the next question is already running
+        if question is None:
+            self.prediction_label.setText(f"The prediction is: {lie_or_truth}")
+        else:
+            self.prediction_label.setText(f"The prediction for '{question}' is: {lie_or_truth}")
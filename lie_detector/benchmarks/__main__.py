@@ -0,0 +1,60 @@
+import argparse
+import sys
+import tempfile
+
+from lie_detector.benchmarks.runner import (
+    BENCHMARKS,
+    compare_results,
+    load_results,
+    print_comparison,
+    run_benchmarks,
+    save_results,
+)
+from lie_detector.benchmarks.suite import Fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the acquisition, preprocessing, loading and inference paths")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and write the results as JSON")
+    run_parser.add_argument("names", nargs="*", help="Only run benchmarks whose name starts with one of these")
+    run_parser.add_argument("--output", help="JSON results file")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--workdir", help="Keeps the generated fixtures between runs (temporary by default)")
+    run_parser.add_argument("--replay", help="Raw recording to benchmark instead of a synthetic one")
+    run_parser.add_argument("--baseline", help="Results file to compare against")
+    run_parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown counted as a regression")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    subparsers.add_parser("list", help="List the benchmarks")
+
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for name in BENCHMARKS:
+            print(name)
+        return 0
+
+    if args.command == "compare":
+        rows = compare_results(load_results(args.baseline), load_results(args.current), args.threshold)
+        return 1 if print_comparison(rows) else 0
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        fixtures = Fixtures(args.workdir or temporary_dir, args.replay)
+        results = run_benchmarks(fixtures, args.names, args.repeat)
+    if args.output:
+        save_results(args.output, results)
+        print(f"Results saved to {args.output}")
+    if args.baseline:
+        rows = compare_results(load_results(args.baseline), results, args.threshold)
+        return 1 if print_comparison(rows) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Optional
+
+import numpy as np
+
+# name -> Benchmark, filled by the @benchmark decorator in suite.py
+BENCHMARKS = {}
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Callable  # setup(fixtures) -> zero-argument callable that is timed
+    repeat: Optional[int] = None  # Overrides the run's repeat count for slow benchmarks
+    warmup: bool = True
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    times: List[float]
+    error: Optional[str] = None
+
+    def summary(self):
+        summary = {"repeat": len(self.times), "unit": "s"}
+        if self.error is not None:
+            summary["error"] = self.error
+        if self.times:
+            summary.update(
+                {
+                    "median": statistics.median(self.times),
+                    "mean": statistics.fmean(self.times),
+                    "min": min(self.times),
+                    "max": max(self.times),
+                    "stdev": statistics.stdev(self.times) if len(self.times) > 1 else 0.0,
+                }
+            )
+        return summary
+
+
+def benchmark(name, repeat=None, warmup=True):
+    def register(setup):
+        BENCHMARKS[name] = Benchmark(name, setup, repeat, warmup)
+        return setup
+
+    return register
+
+
+def measure(function, repeat=5, warmup=1):
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_benchmarks(fixtures, selected=None, repeat=5, report=print):
+    # selected: name prefixes, e.g. ["preprocessing", "inference.predict_numpy"]
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if selected and not any(name.startswith(prefix) for prefix in selected):
+            continue
+        try:
+            function = bench.setup(fixtures)
+            result = BenchmarkResult(name, measure(function, bench.repeat or repeat, warmup=int(bench.warmup)))
+        except Exception as e:
+            result = BenchmarkResult(name, [], error=f"{type(e).__name__}: {e}")
+        summary = result.summary()
+        results[name] = summary
+        if "error" in summary:
+            report(f"{name:45s} failed: {summary['error']}")
+        else:
+            report(f"{name:45s} {summary['median'] * 1000:12.3f} ms (median of {summary['repeat']})")
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+
+def save_results(path, results):
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    return path
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def compare_results(baseline, current, threshold=0.1):
+    # A benchmark regresses when its median grows by more than threshold
+    # (relative) and its fastest run is slower than the baseline's median, which
+    # keeps noisy sub-millisecond benchmarks from flagging on jitter alone
+    rows = []
+    for name in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[name], current[name]
+        if "median" not in before or "median" not in after:
+            continue
+        change = after["median"] / before["median"] - 1 if before["median"] else 0.0
+        if change > threshold and after["min"] > before["median"]:
+            status = "regression"
+        elif change < -threshold:
+            status = "improvement"
+        else:
+            status = "unchanged"
+        rows.append(
+            {"name": name, "baseline": before["median"], "current": after["median"], "change": change, "status": status}
+        )
+    return rows
+
+
+def print_comparison(rows, report=print):
+    for row in rows:
+        report(
+            f"{row['name']:45s} {row['baseline'] * 1000:12.3f} ms -> {row['current'] * 1000:12.3f} ms "
+            f"{row['change']:+8.1%}  {row['status']}"
+        )
+    regressions = [row for row in rows if row["status"] == "regression"]
+    report(f"{len(regressions)} regression(s) in {len(rows)} compared benchmark(s)")
+    return regressions
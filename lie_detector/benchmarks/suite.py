@@ -0,0 +1,350 @@
+import contextlib
+import io
+import os
+from functools import cached_property
+
+import numpy as np
+from scipy.signal import find_peaks, medfilt
+
+from lie_detector.benchmarks.runner import benchmark
+from lie_detector.data_preprocessing.constants import CUTOFF_FREQ
+from lie_detector.data_preprocessing.plot_signals import plot_signals
+from lie_detector.data_preprocessing.process_signals import compute_signals, process_signal, select_features
+from lie_detector.data_preprocessing.utils import (
+    baseline_correction,
+    bjs_filter,
+    butter_lowpass_filter,
+    calculate_ac_dc,
+    calculate_bpm,
+    calculate_ppg,
+    calculate_ratio_of_ratios,
+    convert_ratio_to_spo2,
+    fix_timestamps,
+    kalman_filter,
+)
+from lie_detector.predictor.predictor import LieDetectorModel
+from lie_detector.recording_format import read_samples
+from lie_detector.samples import FrameParser, SampleParser
+from lie_detector.synthetic import (
+    encode_frames,
+    encode_lines,
+    synthesize_features,
+    synthesize_samples,
+    write_dataset,
+    write_raw_csv,
+)
+
+DATASET_SIZES = (100, 1000, 10000)
+DECIMATIONS = (1, 4, 8)
+READ_SIZE = 4096  # Bytes per serial read in the parsing benchmarks
+TRAINING_RECORDINGS = 1000
+
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+class Fixtures:
+    # Inputs shared by the benchmarks, created in workdir on first use. The raw
+    # recording is synthetic unless an archived one is given to replay.
+    def __init__(self, workdir, replay_path=None):
+        self.workdir = workdir
+        self.replay_path = replay_path
+        os.makedirs(workdir, exist_ok=True)
+
+    @cached_property
+    def raw_path(self):
+        if self.replay_path is not None:
+            return self.replay_path
+        return write_raw_csv(os.path.join(self.workdir, "recording_20240101_000000.csv"), synthesize_samples())
+
+    @cached_property
+    def raw_samples(self):
+        return np.asarray(read_samples(self.raw_path))
+
+    @cached_property
+    def serial_lines(self):
+        return encode_lines(self.raw_samples)
+
+    @cached_property
+    def serial_frames(self):
+        return encode_frames(self.raw_samples)
+
+    @cached_property
+    def fixed(self):
+        return fix_timestamps(*self.raw_samples)
+
+    @property
+    def sampling_frequency(self):
+        return 1 / np.mean(np.diff(self.fixed[0]))
+
+    @cached_property
+    def signals(self):
+        return compute_signals(*self.fixed)
+
+    def dataset(self, size):
+        data_dir = os.path.join(self.workdir, f"dataset_{size}", "processed")
+        answers_dir = os.path.join(self.workdir, f"dataset_{size}", "answers")
+        if not os.path.isdir(data_dir) or len(os.listdir(data_dir)) != size:
+            write_dataset(data_dir, answers_dir, size)
+        return data_dir, answers_dir
+
+    @cached_property
+    def training_arrays(self):
+        X = np.stack([synthesize_features(seed) for seed in range(TRAINING_RECORDINGS)])
+        y = np.random.default_rng(0).integers(0, 2, TRAINING_RECORDINGS)
+        return X, y
+
+    @cached_property
+    def model(self):
+        X, y = self.training_arrays
+        lie_detector = LieDetectorModel(None, None)
+        with quiet():
+            lie_detector.train_model(X, y, X[:100], y[:100], epochs=1, batch_size=32)
+        return lie_detector
+
+    @cached_property
+    def inference_weights_path(self):
+        path = os.path.join(self.workdir, "model.npz")
+        self.model.export_inference_weights(path)
+        return path
+
+
+def feed_chunks(parser, data):
+    for start in range(0, len(data), READ_SIZE):
+        parser.feed(data[start : start + READ_SIZE])
+
+
+@benchmark("acquisition.parse_per_line")
+def parse_per_line(fixtures):
+    # What ArduinoReader does for every line
+    lines = fixtures.serial_lines.splitlines(keepends=True)
+
+    def run():
+        for line in lines:
+            data = line.decode("utf-8").rstrip().split(",")
+            if len(data) == 4:
+                timestamp, red, ir, gsr = data
+
+    return run
+
+
+@benchmark("acquisition.parse_ascii_batch")
+def parse_ascii_batch(fixtures):
+    return lambda: feed_chunks(SampleParser(), fixtures.serial_lines)
+
+
+@benchmark("acquisition.parse_binary_frames")
+def parse_binary_frames(fixtures):
+    return lambda: feed_chunks(FrameParser(), fixtures.serial_frames)
+
+
+@benchmark("preprocessing.read_samples")
+def bench_read_samples(fixtures):
+    return lambda: read_samples(fixtures.raw_path)
+
+
+@benchmark("preprocessing.fix_timestamps")
+def bench_fix_timestamps(fixtures):
+    return lambda: fix_timestamps(*fixtures.raw_samples)
+
+
+@benchmark("preprocessing.calculate_ppg")
+def bench_calculate_ppg(fixtures):
+    _, red, ir, _ = fixtures.fixed
+    return lambda: calculate_ppg(red, ir)
+
+
+@benchmark("preprocessing.baseline_correction")
+def bench_baseline_correction(fixtures):
+    timestamps, red, ir, _ = fixtures.fixed
+    ppg = calculate_ppg(red, ir)
+    return lambda: baseline_correction(ppg, timestamps)
+
+
+@benchmark("preprocessing.median_filter")
+def bench_median_filter(fixtures):
+    ppg = fixtures.signals["ppg"]
+    return lambda: medfilt(ppg, kernel_size=3)
+
+
+@benchmark("preprocessing.kalman_filter")
+def bench_kalman_filter(fixtures):
+    ppg = fixtures.signals["ppg"]
+    return lambda: kalman_filter(ppg)
+
+
+@benchmark("preprocessing.lowpass_filter")
+def bench_lowpass_filter(fixtures):
+    ppg = fixtures.signals["ppg"]
+    return lambda: butter_lowpass_filter(ppg, CUTOFF_FREQ, fixtures.sampling_frequency)
+
+
+@benchmark("preprocessing.bjs_filter")
+def bench_bjs_filter(fixtures):
+    gsr = fixtures.fixed[3]
+    return lambda: bjs_filter(gsr, cutoff_freq=CUTOFF_FREQ, sampling_freq=fixtures.sampling_frequency)
+
+
+@benchmark("preprocessing.find_peaks")
+def bench_find_peaks(fixtures):
+    ppg = fixtures.signals["ppg"]
+    return lambda: find_peaks(ppg, height=0.5 * np.max(ppg))
+
+
+@benchmark("preprocessing.spo2")
+def bench_spo2(fixtures):
+    _, red, ir, _ = fixtures.fixed
+
+    def run():
+        ac_red, dc_red = calculate_ac_dc(red)
+        ac_ir, dc_ir = calculate_ac_dc(ir)
+        return convert_ratio_to_spo2(calculate_ratio_of_ratios(ac_red, dc_red, ac_ir, dc_ir))
+
+    return run
+
+
+@benchmark("preprocessing.bpm_interpolation")
+def bench_bpm_interpolation(fixtures):
+    timestamps = fixtures.fixed[0]
+    peaks = fixtures.signals["peaks"]
+
+    def run():
+        bpm, bpm_timestamps = calculate_bpm(peaks, timestamps)
+        bpm = np.interp(timestamps, bpm_timestamps, bpm)
+        return butter_lowpass_filter(bpm, CUTOFF_FREQ, fixtures.sampling_frequency)
+
+    return run
+
+
+@benchmark("preprocessing.compute_signals")
+def bench_compute_signals(fixtures):
+    return lambda: compute_signals(*fixtures.fixed)
+
+
+@benchmark("preprocessing.select_features")
+def bench_select_features(fixtures):
+    return lambda: select_features(fixtures.signals)
+
+
+@benchmark("preprocessing.plot_signals", repeat=3)
+def bench_plot_signals(fixtures):
+    signals = fixtures.signals
+    path = os.path.join(fixtures.workdir, "plot.png")
+
+    def run():
+        with quiet():
+            plot_signals(
+                signals["timestamps"],
+                signals["gsr"],
+                signals["red"],
+                signals["ir"],
+                signals["ppg"],
+                signals["peaks"],
+                signals["spo2"],
+                signals["bpm"],
+                path=path,
+            )
+
+    return run
+
+
+@benchmark("preprocessing.process_signal")
+def bench_process_signal(fixtures):
+    output_dir = os.path.join(fixtures.workdir, "processed")
+    os.makedirs(output_dir, exist_ok=True)
+
+    def run():
+        with quiet():
+            process_signal(fixtures.raw_path, output_dir, feature_cache=None)
+
+    return run
+
+
+def decimated_benchmark(decimation):
+    @benchmark(f"preprocessing.process_signal_decimated[{decimation}]")
+    def bench_process_signal_decimated(fixtures):
+        output_dir = os.path.join(fixtures.workdir, "processed")
+        os.makedirs(output_dir, exist_ok=True)
+
+        def run():
+            with quiet():
+                process_signal(fixtures.raw_path, output_dir, decimation=decimation, feature_cache=None)
+
+        return run
+
+
+for decimation in DECIMATIONS:
+    decimated_benchmark(decimation)
+
+
+def load_data_benchmark(size):
+    @benchmark(f"loading.load_data[{size}]", repeat=3 if size < 10000 else 1, warmup=size < 10000)
+    def bench_load_data(fixtures):
+        lie_detector = LieDetectorModel(*fixtures.dataset(size))
+        return lambda: lie_detector.preprocess_data(*lie_detector.load_data())
+
+    @benchmark(f"loading.load_dataset_cached[{size}]", repeat=3)
+    def bench_load_dataset_cached(fixtures):
+        cache_dir = os.path.join(fixtures.workdir, f"dataset_{size}", "cache")
+        lie_detector = LieDetectorModel(*fixtures.dataset(size), cache_dir=cache_dir)
+        with quiet():
+            lie_detector.load_dataset()  # Builds the cache, the timed runs measure a warm reload
+
+        def run():
+            with quiet():
+                return lie_detector.load_dataset()
+
+        return run
+
+
+for size in DATASET_SIZES:
+    load_data_benchmark(size)
+
+
+@benchmark("training.train_model", repeat=1, warmup=False)
+def bench_train_model(fixtures):
+    X, y = fixtures.training_arrays
+    split = len(X) * 9 // 10
+    lie_detector = LieDetectorModel(None, None)
+
+    def run():
+        with quiet():
+            lie_detector.train_model(X[:split], y[:split], X[split:], y[split:], epochs=10, batch_size=32)
+
+    return run
+
+
+@benchmark("inference.predict_keras")
+def bench_predict_keras(fixtures):
+    window = fixtures.training_arrays[0][0]
+    lie_detector = fixtures.model
+
+    def run():
+        with quiet():
+            return lie_detector.predict(window)
+
+    return run
+
+
+@benchmark("inference.predict_numpy")
+def bench_predict_numpy(fixtures):
+    window = fixtures.training_arrays[0][0]
+    lie_detector = LieDetectorModel(None, None)
+    lie_detector.load_inference_weights(fixtures.inference_weights_path)
+
+    def run():
+        with quiet():
+            return lie_detector.predict(window)
+
+    return run
+
+
+@benchmark("inference.predict_batch_numpy[32]")
+def bench_predict_batch_numpy(fixtures):
+    windows = fixtures.training_arrays[0][:32]
+    lie_detector = LieDetectorModel(None, None)
+    lie_detector.load_inference_weights(fixtures.inference_weights_path)
+    return lambda: lie_detector.predict_batch(windows)
@@ -1,20 +1,40 @@
 import csv
+import os
 import time
 
+import numpy as np
 import serial
 import serial.tools.list_ports
 from PySide6.QtCore import QObject, QThread, Signal, Slot
 from PySide6.QtWidgets import QPushButton, QVBoxLayout, QWidget
 
-from lie_detector.constants import SECONDS_RECORDING
+from lie_detector.constants import (
+    BAUD_RATE,
+    CHUNK_INTERVAL,
+    SAMPLE_BUFFER_CAPACITY,
+    SECONDS_RECORDING,
+    SERIAL_PORT,
+    SERIAL_PROTOCOL,
+)
+from lie_detector.instrumentation import count, timed
+from lie_detector.recording_format import RecordingWriter, is_binary_recording, write_recording
+from lie_detector.samples import PARSERS, SampleBuffer, empty_samples
 
 
-def find_arduino_port():
+def find_arduino_ports():
     ports = list(serial.tools.list_ports.comports())
-    for port in ports:
-        if "Arduino" in port.description or "ttyUSB" in port.device or "ttyACM" in port.device:
-            return port.device
-    return None
+    return [
+        port.device
+        for port in ports
+        if "Arduino" in port.description or "ttyUSB" in port.device or "ttyACM" in port.device
+    ]
+
+
+def find_arduino_port():
+    if SERIAL_PORT:
+        return SERIAL_PORT
+    ports = find_arduino_ports()
+    return ports[0] if ports else None
 
 
 class ArduinoReader(QThread):
@@ -26,7 +46,7 @@ class ArduinoReader(QThread):
         self.running = False
 
     def run(self):
-        with serial.Serial(self.serial_port, 230400, timeout=1) as ser:
+        with serial.Serial(self.serial_port, BAUD_RATE, timeout=1) as ser:
             self.running = True
             start_time = time.time()
             while self.running and (time.time() - start_time < SECONDS_RECORDING):
@@ -44,30 +64,239 @@ class ArduinoReader(QThread):
         self.running = False
 
 
+class BatchArduinoReader(QThread):
+    # Reads the serial port in bulk into a ring buffer and only signals once per
+    # chunk interval; the consumer pulls the samples with buffer.read().
+    chunk_ready = Signal()
+
+    def __init__(
+        self,
+        serial_port,
+        chunk_interval=CHUNK_INTERVAL,
+        buffer_capacity=SAMPLE_BUFFER_CAPACITY,
+        duration=SECONDS_RECORDING,
+        protocol=SERIAL_PROTOCOL,
+    ):
+        super().__init__()
+        self.serial_port = serial_port
+        self.chunk_interval = chunk_interval
+        # None keeps the port open until stop() is called
+        self.duration = duration
+        self.buffer = SampleBuffer(buffer_capacity)
+        self.protocol = protocol
+        self.parser = PARSERS[protocol]()
+        self.running = False
+        self.bytes_read = 0
+
+    @property
+    def parse_errors(self):
+        return self.parser.parse_errors
+
+    @property
+    def dropped_samples(self):
+        return self.buffer.dropped_samples
+
+    @property
+    def lost_frames(self):
+        # Only the binary protocol numbers its frames
+        return getattr(self.parser, "lost_frames", None)
+
+    def run(self):
+        self.parser.reset()
+        parse_errors = self.parser.parse_errors
+        dropped_samples = self.buffer.dropped_samples
+        with serial.Serial(self.serial_port, BAUD_RATE, timeout=self.chunk_interval) as ser:
+            self.running = True
+            start_time = time.time()
+            last_emit = start_time
+            while self.running and (self.duration is None or time.time() - start_time < self.duration):
+                data = ser.read(max(ser.in_waiting, 1))
+                self.bytes_read += len(data)
+                samples = self.parser.feed(data)
+                self.buffer.write(samples)
+                count("serial_bytes_read", len(data))
+                count("samples_received", samples.shape[1])
+
+                now = time.time()
+                if now - last_emit >= self.chunk_interval:
+                    last_emit = now
+                    self.chunk_ready.emit()
+            self.running = False
+        count("parse_errors", self.parser.parse_errors - parse_errors)
+        count("samples_dropped", self.buffer.dropped_samples - dropped_samples)
+        self.chunk_ready.emit()
+
+    def stop(self):
+        self.running = False
+
+
 class DataRecorder(QObject):
-    def __init__(self, serial_port):
+    def __init__(self, serial_port, batched=False, protocol=SERIAL_PROTOCOL):
         super().__init__()
-        self.reader = ArduinoReader(serial_port)
-        self.reader.data_ready.connect(self.record_data)
+        self.batched = batched
+        if batched:
+            self.reader = BatchArduinoReader(serial_port, protocol=protocol)
+            self.reader.chunk_ready.connect(self.record_chunk)
+        else:
+            self.reader = ArduinoReader(serial_port)
+            self.reader.data_ready.connect(self.record_data)
         self.recording = []
+        self.session_running = False
+        self.segment_start = None
+        self.last_timestamp = None
+        # Optional StreamingSignalProcessor fed with every chunk
+        self.processor = None
+        self.writer = None
+        self.first_timestamp = None
+        self.started_at = None
+        # Metadata of the last recording or segment saved, with its sample count
+        self.saved_metadata = None
+        # Reader counters when the current recording or segment started, they
+        # count over the reader's lifetime and the metadata has the difference
+        self.counters_at_start = None
 
     @Slot(list)
     def record_data(self, data):
         self.recording.append(data)
 
-    def start_recording(self):
+    @Slot()
+    def record_chunk(self):
+        samples = self.reader.buffer.read()
+        if samples.shape[1]:
+            if self.writer is not None:
+                self.writer.write(samples)
+            else:
+                self.recording.append(samples)
+            if self.first_timestamp is None:
+                self.first_timestamp = int(samples[0, 0])
+            self.last_timestamp = int(samples[0, -1])
+            if self.processor is not None:
+                self.processor.update(samples)
+
+    def reader_counters(self):
+        return {
+            "parse_errors": self.reader.parse_errors,
+            "dropped_samples": self.reader.dropped_samples,
+            "lost_frames": self.reader.lost_frames,
+        }
+
+    def start_recording(self, path=None):
+        # With a binary path the chunks are written to disk as they arrive
         self.recording = []
+        self.first_timestamp = None
+        self.started_at = time.time()
+        if self.batched:
+            self.reader.buffer.clear()
+            self.counters_at_start = self.reader_counters()
+            if path is not None and is_binary_recording(path):
+                self.writer = RecordingWriter(path, metadata=self.metadata())
         self.reader.start()
 
+    def metadata(self, num_samples=None):
+        metadata = {"baud_rate": BAUD_RATE, "timestamp_unit": "ms", "started_at": self.started_at}
+        if num_samples and self.last_timestamp is not None and self.last_timestamp > self.first_timestamp:
+            metadata["sampling_frequency"] = (num_samples - 1) * 1000 / (self.last_timestamp - self.first_timestamp)
+        if self.batched:
+            for name, value in self.reader_counters().items():
+                if value is not None:
+                    metadata[name] = value - (self.counters_at_start or {}).get(name, 0)
+            metadata["protocol"] = self.reader.protocol
+        return metadata
+
+    @timed("stop_recording_and_save")
     def stop_recording_and_save(self, path):
         self.reader.stop()
         self.reader.wait()
 
-        with open(path, "w", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerows(self.recording)
-        print(f"Recording saved to {path}")
+        if self.batched:
+            # Samples still in the buffer whose chunk signal has not been delivered yet
+            self.record_chunk()
+            if self.writer is not None:
+                num_samples = self.writer.num_samples
+                self.writer.close(**self.metadata(num_samples))
+                if self.writer.path != path:
+                    os.replace(self.writer.path, path)
+                self.writer = None
+            else:
+                samples = np.concatenate(self.recording, axis=1) if self.recording else empty_samples()
+                num_samples = samples.shape[1]
+                self.save_samples(path, samples)
+            self.saved_metadata = dict(self.metadata(num_samples), num_samples=num_samples)
+            print(
+                f"Recording saved to {path} ({num_samples} samples, "
+                f"{self.saved_metadata['parse_errors']} parse errors, {self.saved_metadata['dropped_samples']} dropped)"
+            )
+        else:
+            with open(path, "w", newline="") as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerows(self.recording)
+            self.saved_metadata = dict(self.metadata(), num_samples=len(self.recording))
+            print(f"Recording saved to {path}")
+        self.recording = []
+
+    def discard_recording(self):
+        # For a question that was not answered: stops the recording and deletes
+        # what was written of it, in a continuous session only drops the segment
+        if not self.session_running:
+            self.reader.stop()
+            self.reader.wait()
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(self.writer.path)
+            self.writer = None
+        if self.batched and not self.session_running:
+            self.reader.buffer.clear()
+        self.recording = []
+        self.processor = None
+
+    def save_samples(self, path, samples):
+        if is_binary_recording(path):
+            write_recording(path, samples, metadata=self.metadata(samples.shape[1]))
+        else:
+            np.savetxt(path, samples.T, fmt="%d", delimiter=",")
+
+    # Continuous session: the port is opened once (avoiding the DTR reset of the
+    # board on every reopen) and question windows are cut out of the live stream
+    # using the device timestamps.
+    def start_session(self):
+        if not self.batched:
+            raise ValueError("Continuous sessions require a batched DataRecorder")
+        self.recording = []
+        self.segment_start = None
+        self.last_timestamp = None
+        self.started_at = time.time()
+        self.reader.buffer.clear()
+        self.counters_at_start = self.reader_counters()
+        self.reader.duration = None
+        self.reader.start()
+        self.session_running = True
+
+    def stop_session(self):
+        self.reader.stop()
+        self.reader.wait()
+        self.reader.duration = SECONDS_RECORDING
+        self.session_running = False
+        self.recording = []
+
+    def mark_segment_start(self):
+        self.record_chunk()
+        self.recording = []
+        self.segment_start = self.last_timestamp
+        self.first_timestamp = self.last_timestamp
+        self.counters_at_start = self.reader_counters()
+        return self.segment_start
+
+    @timed("save_segment")
+    def save_segment(self, path):
+        self.record_chunk()
+        samples = np.concatenate(self.recording, axis=1) if self.recording else empty_samples()
+        if self.segment_start is not None:
+            samples = samples[:, samples[0] >= self.segment_start]
+        self.save_samples(path, samples)
+        self.saved_metadata = dict(self.metadata(samples.shape[1]), num_samples=samples.shape[1])
+        print(f"Segment saved to {path} ({samples.shape[1]} samples, {self.saved_metadata['dropped_samples']} dropped)")
         self.recording = []
+        self.segment_start = None
 
 
 class MainWindow(QWidget):
@@ -6,6 +6,10 @@ SERIAL_COMMUNICATION_BITS = 9600
 SECONDS_QUESTION = 10
 SECONDS_RECORDING = 12
 
+BAUD_RATE = 230400
+CHUNK_INTERVAL = 0.1  # Seconds between chunk signals of the batched reader
+SAMPLE_BUFFER_CAPACITY = 1 << 16
+
 load_dotenv()
 
 QUESTIONS_PATH = os.getenv("QUESTIONS_PATH")
@@ -14,3 +18,33 @@ RECORDINGS_PROCESSED_DIR = os.getenv("RECORDINGS_PROCESSED_DIR")
 PLOTS_DIR = os.getenv("PLOTS_DIR")
 ANSWERS_DIR = os.getenv("ANSWERS_DIR")
 MODEL_PATH = os.getenv("MODEL_PATH")
+DATASET_CACHE_DIR = os.getenv("DATASET_CACHE_DIR")
+# Frozen weights for TensorFlow-free inference, defaults to MODEL_PATH with an .npz extension
+INFERENCE_WEIGHTS_PATH = os.getenv("INFERENCE_WEIGHTS_PATH")
+# When set, predictions are requested from python -m lie_detector.predictor.server instead
+PREDICTION_SERVER_URL = os.getenv("PREDICTION_SERVER_URL")
+# Keep the serial port open for the whole session instead of reopening it per question
+CONTINUOUS_SESSION = os.getenv("CONTINUOUS_SESSION", "0") == "1"
+# Compute the answer features from the samples kept in memory instead of reading the saved recording back
+STREAMING_FEATURES = os.getenv("STREAMING_FEATURES", "0") == "1"
+# "ldr" for the binary recording format, "csv" for the old text files
+RECORDING_FORMAT = os.getenv("RECORDING_FORMAT", "ldr")
+# "ascii" for the CSV lines printed by the firmware, "binary" for its BINARY_PROTOCOL frames
+SERIAL_PROTOCOL = os.getenv("SERIAL_PROTOCOL", "ascii")
+# Port to use instead of the first Arduino found, e.g. one served by python -m lie_detector.simulation
+SERIAL_PORT = os.getenv("SERIAL_PORT")
+# Timing and counter metrics, a JSON-lines log or a Prometheus text file when it ends in .prom
+METRICS_PATH = os.getenv("METRICS_PATH")
+# Threads processing answered questions while the next one is recorded, 0 processes them on the GUI thread
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "2"))
+# Answers that may be waiting for their prediction before the next question is held back
+PIPELINE_MAX_PENDING = int(os.getenv("PIPELINE_MAX_PENDING", "4"))
+# SQLite session store for questions, answers, recordings and predictions, answer CSV files when unset
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH")
+# Train on overlapping windows of the whole raw recordings instead of one fixed crop per answer
+TRAINING_WINDOWS = os.getenv("TRAINING_WINDOWS", "0") == "1"
+# Content-addressed cache of process_signal results shared by the GUI, batch preprocessing and experiments
+FEATURE_CACHE_DIR = os.getenv("FEATURE_CACHE_DIR")
+FEATURE_CACHE_MAX_MB = int(os.getenv("FEATURE_CACHE_MAX_MB", "512"))
+# Also cache the filtered signals of the crop, so a changed NUM_SAMPLES does not rerun the filters
+FEATURE_CACHE_SIGNALS = os.getenv("FEATURE_CACHE_SIGNALS", "1") == "1"
@@ -1,15 +1,152 @@
+import argparse
 import glob
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from lie_detector.constants import FEATURE_CACHE_DIR
+from lie_detector.data_preprocessing.manifest import MANIFEST_FILENAME, Manifest, file_hash, processing_fingerprint
 from lie_detector.data_preprocessing.process_signals import process_signal
+from lie_detector.recording_format import RECORDING_EXTENSION
+
+MANIFEST_SAVE_EVERY = 100  # Results between manifest saves during a run
+MANIFEST_SAVE_SECONDS = 10.0
+
+
+@dataclass
+class ProcessingResult:
+    path: str
+    status: str  # "processed", "skipped" or "failed"
+    content_hash: Optional[str] = None
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    duration: float = 0.0
+
+
+def process_file(
+    csv_file: str,
+    output_dir: str,
+    plot_dir: Optional[str] = None,
+    known_hash: Optional[str] = None,
+    decimation: Optional[int] = None,
+    feature_cache: Optional[str] = FEATURE_CACHE_DIR,
+):
+    start = time.perf_counter()
+    content_hash = None
+    try:
+        content_hash = file_hash(csv_file)
+        if content_hash == known_hash:
+            return ProcessingResult(csv_file, "skipped", content_hash)
+        output_path = process_signal(
+            csv_file,
+            output_dir,
+            plot_dir,
+            decimation=decimation,
+            feature_cache=feature_cache,
+            content_hash=content_hash,
+        )
+        return ProcessingResult(csv_file, "processed", content_hash, output_path, duration=time.perf_counter() - start)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        return ProcessingResult(csv_file, "failed", content_hash, error=error, duration=time.perf_counter() - start)
+
 
+def process_directory(
+    root_dir: str,
+    output_dir: str,
+    plot_dir: Optional[str] = None,
+    workers: Optional[int] = None,
+    force: bool = False,
+    decimation: Optional[int] = None,
+    feature_cache: Optional[str] = FEATURE_CACHE_DIR,
+):
+    csv_files = [
+        path
+        for pattern in ("**/*.csv", "**/*" + RECORDING_EXTENSION)
+        for path in glob.glob(os.path.join(root_dir, pattern), recursive=True)
+    ]
+    output_root = os.path.abspath(output_dir)
+    csv_files = [f for f in csv_files if not os.path.abspath(f).startswith(output_root + os.sep)]
 
-def process_directory(root_dir: str, output_dir: str, plot_dir: str):
-    csv_files = glob.glob(os.path.join(root_dir, "**/*.csv"), recursive=True)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_FILENAME))
+    fingerprint = processing_fingerprint(decimation)
 
+    # Workers hash the files themselves and skip the ones the manifest says are current
+    known_hashes = {}
     for csv_file in csv_files:
-        try:
-            process_signal(csv_file, output_dir, plot_dir)
-            print(f"Processed {csv_file}")
-        except Exception as e:
-            print(f"Error processing {csv_file}: {e}")
+        key = os.path.relpath(csv_file, root_dir)
+        entry = manifest.entries.get(key)
+        if not force and entry and manifest.is_current(key, entry["hash"], fingerprint):
+            known_hashes[csv_file] = entry["hash"]
+
+    results = []
+    last_save = time.monotonic()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    process_file, csv_file, output_dir, plot_dir, known_hashes.get(csv_file), decimation, feature_cache
+                )
+                for csv_file in csv_files
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if result.status == "processed":
+                    key = os.path.relpath(result.path, root_dir)
+                    manifest.update(key, result.content_hash, fingerprint, result.output_path)
+                    print(f"Processed {result.path}")
+                elif result.status == "failed":
+                    print(f"Error processing {result.path}: {result.error}")
+                # Saved as the run goes, so an interrupted run keeps what it has done
+                if len(results) % MANIFEST_SAVE_EVERY == 0 or time.monotonic() - last_save >= MANIFEST_SAVE_SECONDS:
+                    manifest.save()
+                    last_save = time.monotonic()
+    finally:
+        manifest.save()
+    order = {csv_file: i for i, csv_file in enumerate(csv_files)}
+    return sorted(results, key=lambda result: order[result.path])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process raw recordings into model features")
+    parser.add_argument("root_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--plot-dir", help="Also render a plot of every processed recording into this directory")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Reprocess recordings listed as current in the manifest")
+    parser.add_argument(
+        "--decimation",
+        type=int,
+        help="Multi-rate mode: decimate by this factor before filtering (overrides WORKING_RATE)",
+    )
+    parser.add_argument(
+        "--feature-cache",
+        default=FEATURE_CACHE_DIR,
+        help="Reuse process_signal results for identical raw data from this cache directory (FEATURE_CACHE_DIR)",
+    )
+    parser.add_argument("--report", help="Write the per-file results as JSON to this path")
+    args = parser.parse_args()
+
+    results = process_directory(
+        args.root_dir,
+        args.output_dir,
+        args.plot_dir,
+        workers=args.workers,
+        force=args.force,
+        decimation=args.decimation,
+        feature_cache=args.feature_cache,
+    )
+
+    counts = {status: sum(r.status == status for r in results) for status in ("processed", "skipped", "failed")}
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=1)
+
 
+if __name__ == "__main__":
+    main()
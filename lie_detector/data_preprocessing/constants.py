@@ -3,3 +3,9 @@ END_TIME = 9.0
 CUTOFF_FREQ = 5
 A = 110.0  
 B = 25.0 
+NUM_SAMPLES = 90
+UNIFORM_TIMESTAMPS = False  # Interpolate onto a uniform grid at the median sampling rate
+WORKING_RATE = None  # Hz the filters run at in multi-rate mode, None processes at the serial rate
+PROCESSING_VERSION = 3  # Bump when process_signal changes its output
+WINDOW_LENGTH = END_TIME - START_TIME  # Seconds per training window, as long as the fixed crop
+WINDOW_STRIDE = 1.0  # Seconds between the starts of overlapping training windows
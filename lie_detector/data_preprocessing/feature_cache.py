@@ -0,0 +1,122 @@
+import os
+import threading
+
+import numpy as np
+
+from lie_detector.constants import FEATURE_CACHE_DIR, FEATURE_CACHE_MAX_MB, FEATURE_CACHE_SIGNALS
+from lie_detector.instrumentation import count
+
+# Content-addressed cache of process_signal results. Entries are keyed by the
+# sha256 of the raw recording and the fingerprint of the stage
+# (manifest.stage_fingerprints), so the same data under another name or in
+# another directory is a hit and a changed constant only misses the stages
+# that depend on it. Stages:
+#   signals   compute_signals output of the crop (filtered PPG and GSR, peaks,
+#             SpO2, BPM), optional as it is much larger than the features
+#   features  the NUM_SAMPLES x 7 model input
+# The directory is bounded by max_bytes: a hit refreshes the mtime of its
+# entry and once the cache grows past the bound the least recently used
+# entries are deleted until it is at EVICT_TO of it. Safe to share between
+# threads and processes, entries are written under a temporary name first.
+STAGE_EXTENSIONS = {"signals": ".npz", "features": ".npy"}
+TMP_EXTENSION = ".tmp"
+EVICT_TO = 0.9
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class FeatureCache:
+    def __init__(self, cache_dir, max_bytes=FEATURE_CACHE_MAX_MB << 20, signals=FEATURE_CACHE_SIGNALS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stages = ("signals", "features") if signals else ("features",)
+        self.lock = threading.Lock()
+        self.size = None  # Bytes on disk, counted on the first put
+
+    def entry_path(self, stage, content_hash, fingerprint):
+        return os.path.join(self.cache_dir, stage, f"{content_hash}_{fingerprint}{STAGE_EXTENSIONS[stage]}")
+
+    def get(self, stage, content_hash, fingerprint):
+        if stage not in self.stages:
+            return None
+        path = self.entry_path(stage, content_hash, fingerprint)
+        try:
+            if stage == "signals":
+                with np.load(path) as entry:
+                    value = {name: entry[name] for name in entry.files}
+            else:
+                value = np.load(path)
+            os.utime(path)
+        except FileNotFoundError:
+            count(f"feature_cache_{stage}_misses")
+            return None
+        count(f"feature_cache_{stage}_hits")
+        return value
+
+    def put(self, stage, content_hash, fingerprint, value):
+        if stage not in self.stages:
+            return
+        path = self.entry_path(stage, content_hash, fingerprint)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}{TMP_EXTENSION}"
+        with open(tmp_path, "wb") as f:
+            if stage == "signals":
+                np.savez(f, **value)
+            else:
+                np.save(f, value)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.size = self.disk_usage() if self.size is None else self.size + size
+            over = self.size > self.max_bytes
+        if over:
+            self.evict()
+
+    def entries(self):
+        # (mtime, size, path) of every entry on disk
+        entries = []
+        for stage in STAGE_EXTENSIONS:
+            directory = os.path.join(self.cache_dir, stage)
+            if not os.path.isdir(directory):
+                continue
+            with os.scandir(directory) as scan:
+                for entry in scan:
+                    if entry.name.endswith(TMP_EXTENSION):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def disk_usage(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # The directory is listed again, other processes may have added or removed entries
+        with self.lock:
+            entries = sorted(self.entries())
+            size = sum(entry_size for _, entry_size, _ in entries)
+            for _, entry_size, path in entries:
+                if size <= EVICT_TO * self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= entry_size
+                count("feature_cache_evictions")
+            self.size = size
+
+
+def open_feature_cache(cache_dir=FEATURE_CACHE_DIR):
+    # One FeatureCache per directory and process, None when cache_dir is not set
+    if not cache_dir:
+        return None
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = _caches[cache_dir] = FeatureCache(cache_dir)
+        return cache
@@ -0,0 +1,73 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import butter, sosfilt, sosfilt_zi
+
+FS_DECIMALS = 1  # Sampling rates are rounded to 0.1 Hz, each recording's rate differs slightly
+CACHE_SIZE = 256  # Designs and cascades kept per FilterBank
+
+
+def stage_key(btype, order, cutoff, fs=None):
+    if np.ndim(cutoff):
+        cutoff = tuple(float(c) for c in cutoff)
+    else:
+        cutoff = float(cutoff)
+    return (btype, int(order), cutoff, None if fs is None else round(float(fs), FS_DECIMALS))
+
+
+class FilterBank:
+    # Butterworth designs in second-order-sections form, designed once and cached
+    # by (type, order, cutoff, fs) with fs rounded to FS_DECIMALS, so recordings
+    # at nearly the same rate share them. Without fs the cutoff is already
+    # normalized to the Nyquist frequency, as in scipy.signal.butter. Both
+    # caches keep the CACHE_SIZE most recently used entries.
+    def __init__(self, cache_size=CACHE_SIZE):
+        self.designed = lru_cache(maxsize=cache_size)(self.design_key)
+        # stages -> (sos, steady state of the sections for a unit step input)
+        self.cascades = lru_cache(maxsize=cache_size)(self.compile_key)
+
+    def design_key(self, key):
+        btype, order, cutoff, fs = key
+        return butter(order, cutoff, btype=btype, fs=fs, output="sos")
+
+    def compile_key(self, keys):
+        sos = np.vstack([self.designed(key) for key in keys])
+        return sos, sosfilt_zi(sos)
+
+    def design(self, btype, order, cutoff, fs=None):
+        return self.designed(stage_key(btype, order, cutoff, fs))
+
+    def compiled(self, stages):
+        return self.cascades(tuple(stage_key(*stage) for stage in stages))
+
+    def cascade(self, *stages):
+        # Adjacent linear stages fused into one set of sections
+        return self.compiled(stages)[0]
+
+    def filtfilt(self, signal, *stages, axis=-1):
+        # Same result as scipy.signal.sosfiltfilt with odd padding, without
+        # recomputing the initial conditions on every call
+        sos, zi = self.compiled(stages)
+        signal = np.moveaxis(np.asarray(signal, dtype=float), axis, -1)
+        ntaps = 2 * len(sos) + 1 - min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+        edge = 3 * ntaps
+        if signal.shape[-1] <= edge:
+            raise ValueError(f"The length of the input vector x must be greater than padlen, which is {edge}.")
+
+        first, last = signal[..., :1], signal[..., -1:]
+        extended = np.concatenate(
+            [2 * first - signal[..., edge:0:-1], signal, 2 * last - signal[..., -2 : -edge - 2 : -1]], axis=-1
+        )
+        zi = zi.reshape((len(sos),) + (1,) * (signal.ndim - 1) + (2,))
+        forward, _ = sosfilt(sos, extended, zi=zi * extended[..., :1])
+        backward, _ = sosfilt(sos, forward[..., ::-1], zi=zi * forward[..., -1:])
+        return np.moveaxis(backward[..., ::-1][..., edge:-edge], -1, axis)
+
+    def lfilter(self, signal, *stages, axis=-1, zi=None):
+        return sosfilt(self.cascade(*stages), signal, axis=axis, zi=zi)
+
+    def lfilter_zi(self, *stages):
+        return self.compiled(stages)[1]
+
+
+filter_bank = FilterBank()
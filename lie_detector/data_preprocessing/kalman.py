@@ -0,0 +1,94 @@
+import numpy as np
+from scipy.signal import lfilter
+
+# Relative distance to the steady-state gain below which the recursion is
+# handed over to lfilter
+GAIN_TOLERANCE = 1e-15
+
+
+class ScalarKalmanFilter:
+    # Random-walk Kalman filter for 1-D signals (x_t = x_{t-1} + w, z_t = x_t + v),
+    # the model pykalman uses with its default parameters. The gain sequence does
+    # not depend on the data, so after the short transient the filter is the
+    # first-order IIR y[t] = (1 - K) y[t-1] + K z[t] and runs through lfilter.
+    # Works along the last axis, so a 2-D array filters one signal per row.
+    def __init__(
+        self,
+        process_noise=1.0,
+        observation_noise=1.0,
+        initial_mean=0.0,
+        initial_covariance=1.0,
+        steady_state=False,
+    ):
+        self.process_noise = process_noise
+        self.observation_noise = observation_noise
+        self.initial_mean = initial_mean
+        self.initial_covariance = initial_covariance
+        self.steady_state = steady_state
+
+        q, r = process_noise, observation_noise
+        predicted_covariance = (q + np.sqrt(q * q + 4 * q * r)) / 2
+        self.steady_gain = predicted_covariance / (predicted_covariance + r)
+        self.reset()
+
+    def reset(self):
+        self.mean = self.initial_mean
+        self.covariance = self.initial_covariance
+        self.started = False
+
+    def transient_gains(self, n):
+        gains = []
+        covariance = self.covariance
+        started = self.started
+        while len(gains) < n:
+            if started:
+                covariance += self.process_noise
+            started = True
+            gain = covariance / (covariance + self.observation_noise)
+            covariance *= 1 - gain
+            gains.append(gain)
+            if abs(gain - self.steady_gain) <= GAIN_TOLERANCE * self.steady_gain:
+                break
+        return np.array(gains), covariance
+
+    def update(self, chunk):
+        chunk = np.asarray(chunk, dtype=float)
+        n = chunk.shape[-1]
+        if n == 0:
+            return chunk.copy()
+
+        mean = np.broadcast_to(self.mean, chunk.shape[:-1]).astype(float)
+        filtered = np.empty_like(chunk)
+
+        if self.steady_state:
+            transient = 0
+        else:
+            gains, covariance = self.transient_gains(n)
+            transient = len(gains)
+            for t, gain in enumerate(gains):
+                mean = mean + gain * (chunk[..., t] - mean)
+                filtered[..., t] = mean
+            self.covariance = covariance
+            self.started = True
+
+        if transient < n:
+            gain = self.steady_gain
+            zi = ((1 - gain) * mean)[..., np.newaxis]
+            filtered[..., transient:], _ = lfilter([gain], [1, gain - 1], chunk[..., transient:], axis=-1, zi=zi)
+            mean = filtered[..., -1]
+
+        self.mean = mean if mean.ndim else float(mean)
+        return filtered
+
+    def filter(self, signal):
+        self.reset()
+        return self.update(signal)
+
+
+def compare_with_pykalman(signal):
+    # Largest absolute difference to pykalman with the defaults kalman_filter used
+    # to rely on; pykalman is only needed for this check.
+    from pykalman import KalmanFilter
+
+    expected, _ = KalmanFilter(initial_state_mean=0, n_dim_obs=1).filter(signal)
+    return np.max(np.abs(ScalarKalmanFilter().filter(signal) - expected.flatten()))
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+
+from lie_detector.data_preprocessing import constants
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def processing_fingerprint(decimation=None):
+    # Changes whenever the processing code version or one of its parameters does
+    parameters = {
+        "version": constants.PROCESSING_VERSION,
+        "start_time": constants.START_TIME,
+        "end_time": constants.END_TIME,
+        "cutoff_freq": constants.CUTOFF_FREQ,
+        "a": constants.A,
+        "b": constants.B,
+        "num_samples": constants.NUM_SAMPLES,
+    }
+    if constants.UNIFORM_TIMESTAMPS:
+        parameters["uniform_timestamps"] = True
+    if decimation is not None or constants.WORKING_RATE is not None:
+        parameters["working_rate"] = constants.WORKING_RATE
+        parameters["decimation"] = decimation
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def stage_fingerprints(start_time=None, end_time=None, decimation=None):
+    # One fingerprint per cached stage of process_signal over only the
+    # parameters that stage depends on, so a change invalidates the stages from
+    # the first one it affects on. start_time/end_time default to the constants.
+    signals = {
+        "version": constants.PROCESSING_VERSION,
+        "start_time": constants.START_TIME if start_time is None else start_time,
+        "end_time": constants.END_TIME if end_time is None else end_time,
+        "cutoff_freq": constants.CUTOFF_FREQ,
+        "a": constants.A,
+        "b": constants.B,
+        "uniform_timestamps": constants.UNIFORM_TIMESTAMPS,
+        "working_rate": constants.WORKING_RATE,
+        "decimation": decimation,
+    }
+    fingerprints = {"signals": hashlib.sha256(json.dumps(signals, sort_keys=True).encode()).hexdigest()[:16]}
+    features = {"signals": fingerprints["signals"], "num_samples": constants.NUM_SAMPLES}
+    fingerprints["features"] = hashlib.sha256(json.dumps(features, sort_keys=True).encode()).hexdigest()[:16]
+    return fingerprints
+
+
+class Manifest:
+    # Maps raw recordings to the content hash and processing fingerprint their
+    # processed output was produced from.
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def is_current(self, key, content_hash, fingerprint):
+        entry = self.entries.get(key)
+        return (
+            entry is not None
+            and entry["hash"] == content_hash
+            and entry["fingerprint"] == fingerprint
+            and os.path.exists(entry["output"])
+        )
+
+    def update(self, key, content_hash, fingerprint, output):
+        self.entries[key] = {"hash": content_hash, "fingerprint": fingerprint, "output": output}
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
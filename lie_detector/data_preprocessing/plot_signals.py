@@ -1,32 +1,50 @@
-import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
 
+from lie_detector.instrumentation import timed
+
+_plot_executor = None
+
+
+@timed("plot_signals")
 def plot_signals(timestamps, gsr_data, red_data, ir_data, ppg_data, peaks, spo2, bpm, path="plots/ir_red.png"):
-    plt.figure(figsize=(12, 10))
-
-    plt.subplot(6, 1, 1)
-    plt.plot(timestamps, gsr_data)
-    plt.title('GSR Data')
-    
-    plt.subplot(6, 1, 2)
-    plt.plot(timestamps, ppg_data)
-    plt.plot(timestamps[peaks], ppg_data[peaks], "x")
-    plt.title('Processed PPG Data with Peaks')
-    
-    plt.subplot(6, 1, 3)
-    plt.plot(timestamps, red_data, label='Red PPG')
-    plt.title('Red PPG')
-
-    plt.subplot(6, 1, 4)
-    plt.plot(timestamps, ir_data, label='IR PPG')
-    plt.title('IR PPG')
-
-    plt.subplot(6, 1, 5)
-    plt.plot(timestamps, spo2)
-    plt.title('Continuous SpO2 Signal')
-    
-    plt.subplot(6, 1, 6)
-    plt.plot(timestamps, bpm)
-    plt.title('Continuous BPM Signal')
-
-    plt.tight_layout()
-    plt.savefig(path)
+    # Imported here so that processing without plots never loads matplotlib. The
+    # figure is drawn on its own Agg canvas instead of through pyplot, so nothing
+    # is kept in pyplot's figure registry and it can run outside the main thread.
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(12, 10))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(6, 1)
+
+    axes[0].plot(timestamps, gsr_data)
+    axes[0].set_title('GSR Data')
+
+    axes[1].plot(timestamps, ppg_data)
+    axes[1].plot(timestamps[peaks], ppg_data[peaks], "x")
+    axes[1].set_title('Processed PPG Data with Peaks')
+
+    axes[2].plot(timestamps, red_data, label='Red PPG')
+    axes[2].set_title('Red PPG')
+
+    axes[3].plot(timestamps, ir_data, label='IR PPG')
+    axes[3].set_title('IR PPG')
+
+    axes[4].plot(timestamps, spo2)
+    axes[4].set_title('Continuous SpO2 Signal')
+
+    axes[5].plot(timestamps, bpm)
+    axes[5].set_title('Continuous BPM Signal')
+
+    fig.tight_layout()
+    fig.savefig(path)
+    print(f"Saved plot to {path}")
+    return path
+
+
+def plot_signals_in_background(*args, **kwargs):
+    # Plots are rendered one at a time on a single worker thread
+    global _plot_executor
+    if _plot_executor is None:
+        _plot_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plot_signals")
+    return _plot_executor.submit(plot_signals, *args, **kwargs)
@@ -1,12 +1,15 @@
-import glob
 import os
+from typing import Optional
 
 import numpy as np
 import pandas as pd
 from scipy.signal import find_peaks, medfilt
 
-from lie_detector.data_preprocessing.constants import CUTOFF_FREQ, END_TIME, START_TIME
-from lie_detector.data_preprocessing.plot_signals import plot_signals
+from lie_detector.constants import FEATURE_CACHE_DIR, RECORDING_FORMAT
+from lie_detector.data_preprocessing.constants import CUTOFF_FREQ, END_TIME, NUM_SAMPLES, START_TIME, WORKING_RATE
+from lie_detector.data_preprocessing.feature_cache import open_feature_cache
+from lie_detector.data_preprocessing.manifest import file_hash, stage_fingerprints
+from lie_detector.data_preprocessing.plot_signals import plot_signals, plot_signals_in_background
 from lie_detector.data_preprocessing.utils import (
     baseline_correction,
     bjs_filter,
@@ -17,20 +20,27 @@ from lie_detector.data_preprocessing.utils import (
     calculate_ratio_of_ratios,
     clip_values,
     convert_ratio_to_spo2,
+    decimate_signals,
+    decimation_factor,
     fix_timestamps,
     kalman_filter,
 )
+from lie_detector.instrumentation import span, timed
+from lie_detector.recording_format import is_binary_recording, read_samples, write_recording
 
 
-def process_signal(data_path: str, output_dir: str, plot_dir: str):
-    # Read CSV data
-    data = pd.read_csv(data_path, header=None)
+FEATURE_COLUMNS = [
+    "Timestamps",
+    "GSR_Data",
+    "Red_PPG_Data",
+    "IR_PPG_Data",
+    "Processed_PPG_Data",
+    "SpO2",
+    "BPM",
+]
 
-    # Extract columns and fix timestamps
-    timestamps, red_data, ir_data, gsr_data = fix_timestamps(
-        data.iloc[:, 0].to_numpy(), data.iloc[:, 1].to_numpy(), data.iloc[:, 2].to_numpy(), data.iloc[:, 3].to_numpy()
-    )
 
+def compute_signals(timestamps, red_data, ir_data, gsr_data):
     # Calculate sampling frequency
     sampling_frequency = 1 / np.mean(np.diff(timestamps))
 
@@ -56,60 +66,195 @@ def process_signal(data_path: str, output_dir: str, plot_dir: str):
     ac_ir, dc_ir = calculate_ac_dc(ir_data)
     ratio_of_ratios = calculate_ratio_of_ratios(ac_red, dc_red, ac_ir, dc_ir)
     spo2 = convert_ratio_to_spo2(ratio_of_ratios)
-    spo2 = butter_lowpass_filter(spo2, CUTOFF_FREQ, sampling_frequency)  # Smooth SpO2 signal
 
     # Calculate BPM
     bpm, bpm_timestamps = calculate_bpm(peaks, timestamps)
 
-    # Interpolate BPM values over the entire timestamp range
+    # Interpolate BPM values over the entire timestamp range and smooth it together with SpO2
     if len(bpm_timestamps) > 1:
         bpm = np.interp(timestamps, bpm_timestamps, bpm)
-        bpm = butter_lowpass_filter(bpm, CUTOFF_FREQ, sampling_frequency)  # Smooth BPM signal
+        spo2, bpm = butter_lowpass_filter(np.vstack([spo2, bpm]), CUTOFF_FREQ, sampling_frequency)
     else:
+        spo2 = butter_lowpass_filter(spo2, CUTOFF_FREQ, sampling_frequency)  # Smooth SpO2 signal
         bpm = np.zeros_like(timestamps)  # Handle cases where there are not enough peaks for BPM calculation
 
-    num_samples = 90
-    if len(timestamps) >= num_samples:
-        indices = np.linspace(0, len(timestamps) - 1, num=num_samples, dtype=int)
-    else:
-        # If there are fewer than 90 samples, repeat or extend the last available sample
-        indices = np.arange(len(timestamps))
-        last_index = len(indices) - 1
-        while len(indices) < num_samples:
-            indices = np.append(indices, last_index)
-
-    selected_timestamps = timestamps[indices]
-    selected_gsr_data = gsr_data[indices]
-    selected_red_data = red_data[indices]
-    selected_ir_data = ir_data[indices]
-    selected_ppg_data = ppg_data[indices]
-    selected_peaks = peaks[np.where((peaks >= 0) & (peaks < len(indices)))]
-    selected_spo2 = spo2[indices]
-    selected_bpm = bpm[indices]
-
-    # Create a DataFrame
-    df = pd.DataFrame(
-        {
-            "Timestamps": selected_timestamps,
-            "GSR_Data": selected_gsr_data,
-            "Red_PPG_Data": selected_red_data,
-            "IR_PPG_Data": selected_ir_data,
-            "Processed_PPG_Data": selected_ppg_data,
-            "SpO2": selected_spo2,
-            "BPM": selected_bpm,
-        }
+    return {
+        "timestamps": timestamps,
+        "gsr": gsr_data,
+        "red": red_data,
+        "ir": ir_data,
+        "ppg": ppg_data,
+        "spo2": spo2,
+        "bpm": bpm,
+        "peaks": peaks,
+    }
+
+
+def select_indices(length, num_samples=NUM_SAMPLES):
+    if length >= num_samples:
+        return np.linspace(0, length - 1, num=num_samples, dtype=int)
+    # If there are fewer than num_samples samples, repeat the last available sample
+    indices = np.arange(length)
+    return np.concatenate([indices, np.full(num_samples - length, length - 1, dtype=int)])
+
+
+def select_features(signals, num_samples=NUM_SAMPLES):
+    indices = select_indices(len(signals["timestamps"]), num_samples)
+    return np.column_stack(
+        [
+            signals["timestamps"][indices],
+            signals["gsr"][indices],
+            signals["red"][indices],
+            signals["ir"][indices],
+            signals["ppg"][indices],
+            signals["spo2"][indices],
+            signals["bpm"][indices],
+        ]
     )
 
-    output_csv_filename = os.path.splitext(os.path.basename(data_path))[0] + "_output.csv"
-    output_csv_path = os.path.join(output_dir, output_csv_filename)
 
-    plot_filename = os.path.splitext(os.path.basename(data_path))[0] + "_plot.png"
-    plot_path = os.path.join(plot_dir, plot_filename)
+def resample_features(signals, num_samples=NUM_SAMPLES):
+    # num_samples points on a uniform grid over the window instead of picked
+    # samples. PPG, GSR, SpO2 and BPM are already low-passed at CUTOFF_FREQ, the
+    # raw red/IR counts are band-limited for the output rate first.
+    timestamps = signals["timestamps"]
+    grid = np.linspace(timestamps[0], timestamps[-1], num_samples)
+    output_nyquist = 0.5 * (num_samples - 1) / (grid[-1] - grid[0])
+    sampling_frequency = 1 / np.mean(np.diff(timestamps))
+    red, ir = butter_lowpass_filter(
+        np.vstack([signals["red"], signals["ir"]]), min(CUTOFF_FREQ, 0.8 * output_nyquist), sampling_frequency
+    )
+    return np.column_stack(
+        [grid]
+        + [
+            np.interp(grid, timestamps, signal)
+            for signal in (signals["gsr"], red, ir, signals["ppg"], signals["spo2"], signals["bpm"])
+        ]
+    )
+
+
+def save_features(features, output_path):
+    if is_binary_recording(output_path):
+        write_recording(output_path, features.T, columns=FEATURE_COLUMNS, dtype="<f8")
+    else:
+        df = pd.DataFrame(features, columns=FEATURE_COLUMNS)
+        df.to_csv(output_path, index=False)
+    print(f"Saved selected data to {output_path}")
+    return output_path
+
+
+def read_signals(data_path, start_time=START_TIME, end_time=END_TIME, decimation=None):
+    # Read the raw CSV or binary recording
+    with span("process_signal.read_samples"):
+        data = read_samples(data_path)
+    return signals_from_samples(data, start_time, end_time, decimation)
+
+
+def signals_from_samples(data, start_time=START_TIME, end_time=END_TIME, decimation=None):
+    # Raw (4, n) samples -> compute_signals output of the window, the stages of
+    # process_signal after reading the recording
+    # Extract columns and fix timestamps
+    with span("process_signal.fix_timestamps"):
+        timestamps, red_data, ir_data, gsr_data = fix_timestamps(
+            data[0], data[1], data[2], data[3], start_time=start_time, end_time=end_time
+        )
+
+    if decimation is None and WORKING_RATE is not None:
+        decimation = decimation_factor(timestamps, WORKING_RATE)
+    if decimation is not None:
+        with span("process_signal.decimate"):
+            timestamps, red_data, ir_data, gsr_data = decimate_signals(
+                timestamps, red_data, ir_data, gsr_data, factor=decimation
+            )
+
+    with span("process_signal.compute_signals"):
+        return compute_signals(timestamps, red_data, ir_data, gsr_data)
+
+
+def features_from_signals(signals, decimation=None, num_samples=NUM_SAMPLES):
+    # Multi-rate mode resamples onto a uniform grid, otherwise samples are picked
+    with span("process_signal.select_features"):
+        if decimation is not None or WORKING_RATE is not None:
+            return resample_features(signals, num_samples)
+        return select_features(signals, num_samples)
+
+
+@timed("process_signal")
+def process_signal(
+    data_path: str,
+    output_dir: str,
+    plot_dir: Optional[str] = None,
+    start_time: float = START_TIME,
+    end_time: float = END_TIME,
+    background_plot: bool = False,
+    output_format: str = RECORDING_FORMAT,
+    decimation: Optional[int] = None,
+    feature_cache: Optional[str] = FEATURE_CACHE_DIR,
+    content_hash: Optional[str] = None,
+):
+    # decimation: multi-rate mode, the signals are decimated by this factor right
+    # after fix_timestamps (derived from WORKING_RATE when that is set) and the
+    # output is resampled onto a uniform grid
+    # feature_cache: FeatureCache directory earlier results for the same raw
+    # data are taken from, None to always compute them; content_hash is the
+    # file_hash of data_path when the caller already has it
+    cache = open_feature_cache(feature_cache)
+    signals = features = None
+    if cache is not None:
+        if content_hash is None:
+            with span("process_signal.hash"):
+                content_hash = file_hash(data_path)
+        fingerprints = stage_fingerprints(start_time, end_time, decimation)
+        features = cache.get("features", content_hash, fingerprints["features"])
+        # The plot needs the signals, the features only when they are not cached themselves
+        if features is None or plot_dir is not None:
+            signals = cache.get("signals", content_hash, fingerprints["signals"])
+
+    if signals is None and (features is None or plot_dir is not None):
+        signals = read_signals(data_path, start_time, end_time, decimation)
+        if cache is not None:
+            cache.put("signals", content_hash, fingerprints["signals"], signals)
+    if features is None:
+        features = features_from_signals(signals, decimation)
+        if cache is not None:
+            cache.put("features", content_hash, fingerprints["features"], features)
+
+    output_filename = os.path.splitext(os.path.basename(data_path))[0] + "_output." + output_format
+    output_path = os.path.join(output_dir, output_filename)
+    with span("process_signal.save_features"):
+        save_features(features, output_path)
+
+    # Plotting is optional and can be moved off the caller's thread
+    if plot_dir is not None:
+        plot_filename = os.path.splitext(os.path.basename(data_path))[0] + "_plot.png"
+        plot_path = os.path.join(plot_dir, plot_filename)
+        plot_args = (
+            signals["timestamps"],
+            signals["gsr"],
+            signals["red"],
+            signals["ir"],
+            signals["ppg"],
+            signals["peaks"],
+            signals["spo2"],
+            signals["bpm"],
+        )
+        if background_plot:
+            plot_signals_in_background(*plot_args, path=plot_path)
+        else:
+            plot_signals(*plot_args, path=plot_path)
+
+    return output_path
 
-    df.to_csv(output_csv_path, index=False)
-    print(f"Saved selected data to {output_csv_path}")
 
-    plot_signals(timestamps, gsr_data, red_data, ir_data, ppg_data, peaks, spo2, bpm, path=plot_path)
-    print(f"Saved plot to {plot_path}")
+def compare_with_full_rate(data_path, decimation, start_time=START_TIME, end_time=END_TIME):
+    # Per feature column, the largest deviation of the multi-rate output from the
+    # full-rate output relative to the range of the full-rate output
+    data = read_samples(data_path)
+    fixed = fix_timestamps(data[0], data[1], data[2], data[3], start_time=start_time, end_time=end_time)
+    full_rate = select_features(compute_signals(*fixed))
+    timestamps, *signals = decimate_signals(*fixed, factor=decimation)
+    decimated = resample_features(compute_signals(timestamps, *signals))
 
-    return output_csv_path
+    scale = np.ptp(full_rate, axis=0)
+    scale[scale == 0] = 1
+    return np.max(np.abs(decimated - full_rate), axis=0) / scale
@@ -0,0 +1,62 @@
+import numpy as np
+
+from lie_detector.data_preprocessing.constants import END_TIME, NUM_SAMPLES, START_TIME
+from lie_detector.data_preprocessing.process_signals import features_from_signals, signals_from_samples
+from lie_detector.recording_format import read_samples
+from lie_detector.samples import empty_samples
+
+
+class StreamingSignalProcessor:
+    # Keeps the raw (4, n) chunks of the recording in memory as they arrive, so
+    # the features of the answer window are computed as soon as it closes,
+    # without waiting for the recording to be written and read back.
+    #
+    # The features go through the same stages as process_signal and are
+    # identical to its output for the saved recording: the model is trained on
+    # that output, and the zero-phase filters, the baseline fit and the
+    # normalizations over the whole window have no causal equivalent that
+    # matches them (causal approximations were off by up to 50% of the column
+    # range for PPG and more for SpO2).
+    def __init__(self, start_time=START_TIME, end_time=END_TIME, num_samples=NUM_SAMPLES):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.num_samples = num_samples
+        self.reset()
+
+    def reset(self):
+        self.chunks = []
+
+    def update(self, samples):
+        samples = np.asarray(samples)
+        if samples.shape[1]:
+            self.chunks.append(samples)
+
+    def samples(self):
+        return np.concatenate(self.chunks, axis=1) if self.chunks else empty_samples()
+
+    def signals(self, decimation=None):
+        samples = self.samples()
+        if samples.shape[1] < 2:
+            raise ValueError("No samples received inside the answer window")
+        return signals_from_samples(samples, self.start_time, self.end_time, decimation)
+
+    def features(self, decimation=None):
+        return features_from_signals(self.signals(decimation), decimation, self.num_samples)
+
+
+def compare_with_batch(data_path, chunk_size=64, start_time=START_TIME, end_time=END_TIME):
+    # Replays a raw recording through the streaming processor and reports, per
+    # feature column, the largest deviation from process_signal relative to the
+    # range of the batch output.
+    data = read_samples(data_path)
+
+    batch = features_from_signals(signals_from_samples(data, start_time, end_time))
+
+    processor = StreamingSignalProcessor(start_time=start_time, end_time=end_time)
+    for start in range(0, data.shape[1], chunk_size):
+        processor.update(data[:, start : start + chunk_size])
+    streamed = processor.features()
+
+    scale = np.ptp(batch, axis=0)
+    scale[scale == 0] = 1
+    return np.max(np.abs(streamed - batch), axis=0) / scale
@@ -1,16 +1,20 @@
+from dataclasses import dataclass
+
 import numpy as np
-from pykalman import KalmanFilter
-from scipy.signal import butter, filtfilt
+from scipy.signal import resample_poly
+
+from lie_detector.data_preprocessing.constants import A, B, END_TIME, START_TIME, UNIFORM_TIMESTAMPS
+from lie_detector.data_preprocessing.filters import filter_bank
+from lie_detector.data_preprocessing.kalman import ScalarKalmanFilter
+from lie_detector.instrumentation import count
 
-from lie_detector.data_preprocessing.constants import A, B, END_TIME, START_TIME
+MILLIS_WRAP = 1 << 32  # millis() is an unsigned long on the Arduino
+RESET_JUMP_MS = 1000  # Steps back by more than this are a board reset, smaller ones glitches
+GAP_FACTOR = 1.75  # Intervals this many times the median one are gaps from lost samples
 
 
-def bjs_filter(signal, cutoff_freq, sampling_freq, filter_order=2):
-    nyquist_freq = 0.5 * sampling_freq
-    normalized_cutoff = cutoff_freq / nyquist_freq
-    b, a = butter(filter_order, normalized_cutoff, btype="low")
-    filtered_signal = filtfilt(b, a, signal)
-    return filtered_signal
+def bjs_filter(signal, cutoff_freq, sampling_freq, filter_order=2, axis=-1):
+    return filter_bank.filtfilt(signal, ("low", filter_order, cutoff_freq, sampling_freq), axis=axis)
 
 
 def calculate_SpO2(red_count, ir_count):
@@ -23,19 +27,13 @@ def calculate_SpO2(red_count, ir_count):
     return SpO2, R
 
 
-def butter_lowpass_filter(data, cutoff_freq, fs, order=4):
-    nyquist = 0.5 * fs
-    normal_cutoff = cutoff_freq / nyquist
-    b, a = butter(order, normal_cutoff, btype="low", analog=False)
-    y = filtfilt(b, a, data)
-    return y
+def butter_lowpass_filter(data, cutoff_freq, fs, order=4, axis=-1):
+    return filter_bank.filtfilt(data, ("low", order, cutoff_freq, fs), axis=axis)
 
 
-def calculate_ppg(red_data, ir_data):
+def calculate_ppg(red_data, ir_data, axis=-1):
     ppg_data = red_data - ir_data
-    b, a = butter(4, 0.5, "low")
-    ppg_data_filtered = filtfilt(b, a, ppg_data)
-    return ppg_data_filtered
+    return filter_bank.filtfilt(ppg_data, ("low", 4, 0.5), axis=axis)
 
 
 def baseline_correction(signal, timestamps, degree=3):
@@ -45,28 +43,137 @@ def baseline_correction(signal, timestamps, degree=3):
     return corrected_signal
 
 
-def notch_filter(signal, freq, fs, Q=30):
+def notch_filter(signal, freq, fs, Q=30, axis=-1):
     # Notch filter to remove power line interference at freq Hz
-    nyquist = 0.5 * fs
-    normal_freq = freq / nyquist
-    b, a = butter(4, [normal_freq - 1 / (2 * Q), normal_freq + 1 / (2 * Q)], btype="bandstop", analog=False)
-    filtered_signal = filtfilt(b, a, signal)
-    return filtered_signal
+    return filter_bank.filtfilt(signal, notch_stage(freq, fs, Q), axis=axis)
+
+
+def notch_stage(freq, fs, Q=30):
+    normal_freq = freq / (0.5 * fs)
+    return ("bandstop", 4, (normal_freq - 1 / (2 * Q), normal_freq + 1 / (2 * Q)))
+
 
+def kalman_filter(signal, process_noise=1.0, observation_noise=1.0, steady_state=False):
+    # Apply Kalman filter to the signal (or to each row of a 2-D array)
+    kf = ScalarKalmanFilter(process_noise, observation_noise, steady_state=steady_state)
+    return kf.filter(signal)
 
-def kalman_filter(signal):
-    # Apply Kalman filter to the signal
-    kf = KalmanFilter(initial_state_mean=0, n_dim_obs=1)
-    filtered_state_means, _ = kf.filter(signal)
-    return filtered_state_means.flatten()
+
+def decimation_factor(timestamps, working_rate):
+    sampling_frequency = 1 / np.mean(np.diff(timestamps))
+    return max(1, int(round(sampling_frequency / working_rate)))
+
+
+def decimate_signals(timestamps, *signals, factor):
+    # Anti-aliased polyphase decimation of uniformly sampled signals by an
+    # integer factor; the line padding keeps the large DC offsets of the raw
+    # red/IR counts from ringing at the edges
+    if factor == 1:
+        return (timestamps, *signals)
+    decimated = resample_poly(np.vstack(signals).astype(float), 1, factor, axis=-1, padtype="line")
+    sampling_interval = np.mean(np.diff(timestamps)) * factor
+    timestamps = timestamps[0] + np.arange(decimated.shape[1]) * sampling_interval
+    return (timestamps, *decimated)
 
 
 def find_first_consistent_idx(timestamps):
     # Find the index where timestamps become consistent
-    for i in range(len(timestamps) - 1):
-        if timestamps[i + 1] <= timestamps[i]:
-            return i + 1
-    return 0  # If all timestamps are consistently increasing
+    inconsistent = np.flatnonzero(np.diff(timestamps) <= 0)
+    return inconsistent[0] + 1 if len(inconsistent) else 0  # 0 if all timestamps are consistently increasing
+
+
+@dataclass
+class TimestampReport:
+    samples: int
+    reset_samples: int = 0  # Left over from before the last board reset
+    wraparounds: int = 0
+    out_of_order: int = 0  # Timestamps stepping backwards, dropped
+    duplicates: int = 0  # Repeated timestamps, spread out
+    gaps: int = 0
+    missing_samples: int = 0  # Estimated from the length of the gaps
+    longest_gap: float = 0.0  # Seconds
+    sampling_frequency: float = float("nan")  # From the median interval
+
+    @property
+    def drop_rate(self):
+        kept = self.samples - self.reset_samples - self.out_of_order
+        return self.missing_samples / (kept + self.missing_samples) if kept + self.missing_samples else 0.0
+
+
+def sanitize_timestamps(timestamps, *signals, uniform=False, reset_jump=RESET_JUMP_MS):
+    # Raw millis() timestamps -> strictly increasing seconds from the first
+    # sample after the last board reset, with the signals kept in step. Returns
+    # (report, timestamps, *signals).
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    report = TimestampReport(len(timestamps))
+    if len(timestamps) < 2:
+        return (report, (timestamps - timestamps[:1]) / 1000, *signals)
+
+    # Unwrapped like np.unwrap: a step of more than half the range either way
+    # crosses the wrap point (a glitch can cross it back)
+    steps = np.diff(timestamps)
+    wraps = (steps < -(MILLIS_WRAP // 2)).astype(np.int64) - (steps > MILLIS_WRAP // 2)
+    report.wraparounds = int(np.count_nonzero(wraps))
+    if report.wraparounds:
+        timestamps = timestamps + MILLIS_WRAP * np.concatenate([[0], np.cumsum(wraps)])
+        steps = np.diff(timestamps)
+
+    resets = np.flatnonzero(steps < -reset_jump)
+    if len(resets):
+        report.reset_samples = int(resets[-1] + 1)
+        timestamps = timestamps[report.reset_samples :]
+        signals = [signal[report.reset_samples :] for signal in signals]
+
+    # Drop samples earlier than one before them
+    steps = np.diff(timestamps)
+    if np.any(steps < 0):
+        previous_max = np.maximum.accumulate(np.concatenate([[timestamps[0]], timestamps[:-1]]))
+        in_order = timestamps >= previous_max
+        report.out_of_order = int(len(in_order) - np.count_nonzero(in_order))
+        timestamps = timestamps[in_order]
+        signals = [signal[in_order] for signal in signals]
+        steps = np.diff(timestamps)
+
+    # The clock only counts whole milliseconds, so at high sample rates several
+    # samples share a timestamp; they are spread evenly up to the next one
+    run_starts = np.flatnonzero(np.concatenate([[True], steps != 0]))
+    report.duplicates = int(len(timestamps) - len(run_starts))
+    if report.duplicates:
+        run_values = timestamps[run_starts]
+        run_steps = np.diff(run_values)
+        run_steps = np.append(run_steps, np.median(run_steps) if len(run_steps) else 1)
+        run_lengths = np.diff(np.append(run_starts, len(timestamps)))
+        runs = np.repeat(np.arange(len(run_starts)), run_lengths)
+        offsets = np.arange(len(timestamps)) - run_starts[runs]
+        timestamps = timestamps + offsets * (run_steps / run_lengths)[runs]
+
+    timestamps = timestamps / 1000
+    timestamps = timestamps - timestamps[0]
+
+    steps = np.diff(timestamps)
+    if len(steps):
+        interval = np.median(steps)
+        report.sampling_frequency = 1 / interval
+        gaps = steps[steps > GAP_FACTOR * interval]
+        report.gaps = len(gaps)
+        report.missing_samples = int(np.sum(np.rint(gaps / interval) - 1))
+        report.longest_gap = float(gaps.max()) if len(gaps) else 0.0
+
+    if uniform and len(steps):
+        # Gaps are bridged by linear interpolation
+        grid = np.arange(0, timestamps[-1] + 0.5 / report.sampling_frequency, 1 / report.sampling_frequency)
+        signals = [np.interp(grid, timestamps, signal) for signal in signals]
+        timestamps = grid
+    return (report, timestamps, *signals)
+
+
+def nearest_index(timestamps, value):
+    # np.argmin(np.abs(timestamps - value)) for increasing timestamps, ties going
+    # to the earlier sample
+    index = np.searchsorted(timestamps, value)
+    if index == len(timestamps) or (index > 0 and value - timestamps[index - 1] <= timestamps[index] - value):
+        return max(index - 1, 0)
+    return index
 
 
 def clip_values(ppg_data):
@@ -108,20 +215,18 @@ def calculate_bpm(peaks, timestamps):
     return bpm, bpm_timestamps
 
 
-def fix_timestamps(timestamps, red_data, ir_data, gsr_data):
-    timestamps = timestamps / 1000  # In milis
-
-    first_consistent_idx = find_first_consistent_idx(timestamps)
-
-    timestamps = timestamps[first_consistent_idx:]
-    red_data = red_data[first_consistent_idx:]
-    ir_data = ir_data[first_consistent_idx:]
-    gsr_data = gsr_data[first_consistent_idx:]
-
-    timestamps = timestamps - timestamps[0]
+def fix_timestamps(
+    timestamps, red_data, ir_data, gsr_data, start_time=START_TIME, end_time=END_TIME, uniform=UNIFORM_TIMESTAMPS
+):
+    report, timestamps, red_data, ir_data, gsr_data = sanitize_timestamps(
+        timestamps, red_data, ir_data, gsr_data, uniform=uniform
+    )
+    count("timestamp_gaps", report.gaps)
+    count("samples_missing", report.missing_samples)
+    count("samples_out_of_order", report.out_of_order)
 
-    start_idx = np.argmin(np.abs(timestamps - START_TIME))
-    end_idx = np.argmin(np.abs(timestamps - END_TIME))
+    start_idx = nearest_index(timestamps, start_time)
+    end_idx = nearest_index(timestamps, end_time)
 
     if start_idx > end_idx:
         start_idx, end_idx = end_idx, start_idx
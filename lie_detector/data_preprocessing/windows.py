@@ -0,0 +1,190 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from lie_detector.data_preprocessing.constants import (
+    NUM_SAMPLES,
+    START_TIME,
+    UNIFORM_TIMESTAMPS,
+    WINDOW_LENGTH,
+    WINDOW_STRIDE,
+)
+from lie_detector.data_preprocessing.manifest import processing_fingerprint
+from lie_detector.data_preprocessing.process_signals import (
+    FEATURE_COLUMNS,
+    features_from_signals,
+    select_indices,
+    signals_from_samples,
+)
+from lie_detector.data_preprocessing.utils import sanitize_timestamps
+from lie_detector.instrumentation import count, span
+from lie_detector.recording_format import read_features, read_samples
+
+# Overlapping training windows cut lazily out of whole recordings. Every window
+# goes through the stages of process_signal on its own span of the raw
+# recording, as if it were the fixed crop: the filters, the GSR normalization
+# and SpO2/BPM only see the window, like at inference. Computing them once over
+# the whole recording and slicing would include the reconnect transient and
+# give the model a different input distribution than it is served.
+# The windows of a recording are computed together the first time one of them
+# is requested and stacked into a (windows, num_samples, 7) array, which is
+# what gets cached.
+WINDOWS_EXTENSION = ".npy"
+MAX_CACHED_RECORDINGS = 64  # Recordings whose windows are kept open in memory
+
+
+def is_processed_recording(path):
+    return os.path.splitext(path)[0].endswith("_output")
+
+
+def raw_timestamps(samples, uniform=UNIFORM_TIMESTAMPS):
+    # Seconds from the start of the recording, as fix_timestamps sees them
+    return sanitize_timestamps(*samples[:1], uniform=uniform)[1]
+
+
+def window_features(samples, start, length=WINDOW_LENGTH, num_samples=NUM_SAMPLES):
+    # The process_signal output for a crop from start to start + length seconds,
+    # with the timestamps shifted so that it starts at START_TIME like the fixed crop
+    window = features_from_signals(signals_from_samples(samples, start, start + length), num_samples=num_samples)
+    window[:, 0] += START_TIME - start
+    return window
+
+
+class RecordingWindows:
+    # Where the windows of one raw recording are: length seconds every stride
+    # seconds from START_TIME (the reconnect transient is skipped). The window
+    # at START_TIME is the fixed crop of process_signal.
+    def __init__(self, timestamps, length=WINDOW_LENGTH, stride=WINDOW_STRIDE):
+        self.length = length
+        if len(timestamps):
+            first = max(START_TIME, timestamps[0])
+            # A small tolerance so a recording exactly one window long still has one
+            self.starts = np.arange(first, timestamps[-1] - length + 1e-6, stride)
+        else:
+            self.starts = np.empty(0)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def features(self, samples, num_samples=NUM_SAMPLES):
+        windows = np.empty((len(self), num_samples, len(FEATURE_COLUMNS)))
+        for i, start in enumerate(self.starts):
+            windows[i] = window_features(samples, start, self.length, num_samples)
+        return windows
+
+
+class WindowCache:
+    # The stacked windows of every recording. Those of raw recordings are saved
+    # under cache_dir as .npy files named after the recording path, its (mtime,
+    # size), the window length, stride and resolution and the processing
+    # fingerprint, and memory-mapped from there; without cache_dir they are
+    # only kept in memory. A processed recording already is a crop and is one
+    # window as is. The last max_recordings stay open. Thread-safe, windows
+    # requested by two threads at once may be computed twice.
+    def __init__(self, cache_dir=None, max_recordings=MAX_CACHED_RECORDINGS):
+        self.cache_dir = cache_dir
+        self.max_recordings = max_recordings
+        self.recordings = OrderedDict()
+        self.lock = threading.Lock()
+        self.fingerprint = processing_fingerprint()
+
+    def windows_key(self, path, length, stride, num_samples):
+        stat = os.stat(path)
+        key = (
+            f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}:{self.fingerprint}:"
+            f"{length}:{stride}:{num_samples}"
+        )
+        return hashlib.sha256(key.encode()).hexdigest()[:24]
+
+    def windows_path(self, key):
+        return os.path.join(self.cache_dir, key + WINDOWS_EXTENSION) if self.cache_dir else None
+
+    def cached(self, key):
+        with self.lock:
+            windows = self.recordings.get(key)
+            if windows is not None:
+                self.recordings.move_to_end(key)
+                return windows
+        windows_path = self.windows_path(key)
+        if windows_path is not None and os.path.exists(windows_path):
+            count("window_cache_hits")
+            return self.keep(key, np.load(windows_path, mmap_mode="r"))
+        return None
+
+    def keep(self, key, windows):
+        with self.lock:
+            self.recordings[key] = windows
+            if len(self.recordings) > self.max_recordings:
+                self.recordings.popitem(last=False)
+        return windows
+
+    def get(self, path, length=WINDOW_LENGTH, stride=WINDOW_STRIDE, num_samples=NUM_SAMPLES):
+        key = self.windows_key(path, length, stride, num_samples)
+        windows = self.cached(key)
+        if windows is not None:
+            return windows
+
+        if is_processed_recording(path):
+            features = np.asarray(read_features(path), dtype=np.float64)
+            return self.keep(key, features[None, select_indices(len(features), num_samples)])
+
+        count("window_cache_misses")
+        with span("windows.compute_windows"):
+            samples = read_samples(path)
+            windows = RecordingWindows(raw_timestamps(samples), length, stride).features(samples, num_samples)
+        windows_path = self.windows_path(key)
+        if windows_path is None:
+            return self.keep(key, windows)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.save(windows_path + ".tmp.npy", windows)
+        os.replace(windows_path + ".tmp.npy", windows_path)
+        return self.keep(key, np.load(windows_path, mmap_mode="r"))
+
+    def count_windows(self, path, length=WINDOW_LENGTH, stride=WINDOW_STRIDE, num_samples=NUM_SAMPLES):
+        # Without running the DSP when the windows are not cached
+        if is_processed_recording(path):
+            return 1
+        windows = self.cached(self.windows_key(path, length, stride, num_samples))
+        if windows is not None:
+            return len(windows)
+        return len(RecordingWindows(raw_timestamps(read_samples(path)), length, stride))
+
+
+class WindowDataset:
+    # All windows of a list of labelled recordings as one lazily indexed
+    # sequence of (window, label). records: (key, recording path, label).
+    # Indexing only needs the timestamps; the windows of a recording are
+    # computed (or mapped from the cache) the first time one of them is requested.
+    def __init__(self, records, length=WINDOW_LENGTH, stride=WINDOW_STRIDE, num_samples=NUM_SAMPLES, cache=None):
+        self.records = list(records)
+        self.length = length
+        self.stride = stride
+        self.num_samples = num_samples
+        self.cache = cache or WindowCache()
+        self.counts = np.array(
+            [self.cache.count_windows(path, length, stride, num_samples) for _, path, _ in self.records], dtype=np.int64
+        )
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+
+    @property
+    def shape(self):
+        return (len(self), self.num_samples, len(FEATURE_COLUMNS))
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def locate(self, index):
+        recording = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        return recording, int(index - self.offsets[recording])
+
+    def __getitem__(self, index):
+        recording, window = self.locate(index)
+        _, path, label = self.records[recording]
+        windows = self.cache.get(path, self.length, self.stride, self.num_samples)
+        return np.array(windows[window], dtype=np.float64), label
+
+    def labels(self):
+        return np.repeat(np.array([label for _, _, label in self.records], dtype=float), self.counts)
@@ -0,0 +1,137 @@
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+from lie_detector.constants import METRICS_PATH
+
+# Named spans (timers) and counters along the recording -> prediction path.
+# Disabled when METRICS_PATH is unset or empty: span() then hands out a shared
+# no-op context manager and count() returns straight away. Enabled, a path
+# ending in .prom gets a Prometheus text snapshot rewritten on every flush,
+# anything else a JSON-lines log with one line per span and a line with the
+# counter totals on every flush.
+PROMETHEUS_EXTENSION = ".prom"
+METRIC_PREFIX = "lie_detector"
+FLUSH_EVENTS = 256
+
+_disabled_span = contextlib.nullcontext()
+
+
+class Span:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class Metrics:
+    def __init__(self, path=None):
+        self.path = path
+        self.enabled = bool(path)
+        self.prometheus = self.enabled and path.endswith(PROMETHEUS_EXTENSION)
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.spans = {}  # name -> [count, total seconds, max seconds]
+        self.events = []
+        if self.enabled:
+            atexit.register(self.flush)
+
+    def span(self, name):
+        if not self.enabled:
+            return _disabled_span
+        return Span(self, name)
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            stats = self.spans.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            self.events.append({"time": time.time(), "span": name, "seconds": seconds})
+            flush = len(self.events) >= FLUSH_EVENTS
+        if flush:
+            self.flush()
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def timed(self, name):
+        # Decorator form of span()
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "spans": {
+                    name: {"count": count, "total_seconds": total, "max_seconds": maximum}
+                    for name, (count, total, maximum) in self.spans.items()
+                },
+            }
+
+    def flush(self):
+        if not self.enabled:
+            return
+        with self.lock:
+            events, self.events = self.events, []
+            counters = dict(self.counters)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.prometheus:
+            self.write_prometheus(self.path)
+        else:
+            events.append({"time": time.time(), "counters": counters})
+            with open(self.path, "a") as f:
+                f.writelines(json.dumps(event) + "\n" for event in events)
+
+    def write_prometheus(self, path):
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"{METRIC_PREFIX}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        if snapshot["spans"]:
+            metric = f"{METRIC_PREFIX}_span_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for name, stats in sorted(snapshot["spans"].items()):
+                lines.append(f'{metric}_count{{span="{name}"}} {stats["count"]}')
+                lines.append(f'{metric}_sum{{span="{name}"}} {stats["total_seconds"]}')
+            lines.append(f"# TYPE {metric}_max gauge")
+            for name, stats in sorted(snapshot["spans"].items()):
+                lines.append(f'{metric}_max{{span="{name}"}} {stats["max_seconds"]}')
+        # Replaced atomically so a scraper never reads a half written file
+        with open(path + ".tmp", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+
+
+metrics = Metrics(METRICS_PATH)
+span = metrics.span
+count = metrics.count
+timed = metrics.timed
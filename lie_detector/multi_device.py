@@ -0,0 +1,192 @@
+import os
+import selectors
+import time
+
+import serial
+from PySide6.QtCore import QObject, QThread, Signal, Slot
+
+from lie_detector.connect import find_arduino_ports
+from lie_detector.constants import BAUD_RATE, CHUNK_INTERVAL, SAMPLE_BUFFER_CAPACITY, SERIAL_PROTOCOL
+from lie_detector.recording_format import RecordingWriter
+from lie_detector.samples import PARSERS, SampleBuffer
+
+
+def device_id(port):
+    return os.path.basename(port)
+
+
+class DeviceStream:
+    def __init__(self, port, buffer_capacity=SAMPLE_BUFFER_CAPACITY, protocol=SERIAL_PROTOCOL):
+        self.port = port
+        self.device_id = device_id(port)
+        self.serial = None
+        self.parser = PARSERS[protocol]()
+        self.buffer = SampleBuffer(buffer_capacity)
+        self.bytes_read = 0
+        self.opened_at = None
+        self.counters_at_open = self.counters()
+
+    def open(self):
+        # Non-blocking reads, the selector tells when data is waiting
+        self.serial = serial.Serial(self.port, BAUD_RATE, timeout=0)
+        self.opened_at = time.time()
+        # The parser and buffer live as long as the stream, metrics cover this run
+        self.counters_at_open = self.counters()
+
+    def close(self):
+        if self.serial is not None:
+            self.serial.close()
+            self.serial = None
+
+    def read(self):
+        data = self.serial.read(max(self.serial.in_waiting, 1))
+        self.bytes_read += len(data)
+        self.buffer.write(self.parser.feed(data))
+        return len(data)
+
+    def counters(self):
+        return {
+            "bytes_read": self.bytes_read,
+            "samples": self.parser.samples_parsed,
+            "parse_errors": self.parser.parse_errors,
+            "dropped_samples": self.buffer.dropped_samples,
+            "lost_frames": getattr(self.parser, "lost_frames", None),
+        }
+
+    def metrics(self):
+        elapsed = time.time() - self.opened_at if self.opened_at else 0.0
+        counters = {
+            name: value - self.counters_at_open[name] if value is not None else None
+            for name, value in self.counters().items()
+        }
+        return {
+            "port": self.port,
+            **counters,
+            "samples_per_second": counters["samples"] / elapsed if elapsed else 0.0,
+            "bytes_per_second": counters["bytes_read"] / elapsed if elapsed else 0.0,
+        }
+
+
+class DeviceMultiplexer:
+    # Reads every device from a single thread with a selector over the serial
+    # file descriptors (POSIX only) and calls on_chunk(device_id) for each device
+    # with new samples at most once per chunk interval
+    def __init__(self, ports=None, chunk_interval=CHUNK_INTERVAL, on_chunk=None, protocol=SERIAL_PROTOCOL):
+        if ports is None:
+            ports = find_arduino_ports()
+        self.streams = {device_id(port): DeviceStream(port, protocol=protocol) for port in ports}
+        self.chunk_interval = chunk_interval
+        self.on_chunk = on_chunk
+        self.running = False
+
+    def run(self, duration=None):
+        selector = selectors.DefaultSelector()
+        self.running = True
+        pending = set()
+        try:
+            # Inside the try so the ports already open are closed when one fails to open
+            for stream in self.streams.values():
+                stream.open()
+                selector.register(stream.serial.fileno(), selectors.EVENT_READ, stream)
+
+            start_time = time.time()
+            last_emit = start_time
+            while self.running and (duration is None or time.time() - start_time < duration):
+                for key, _ in selector.select(timeout=self.chunk_interval):
+                    stream = key.data
+                    try:
+                        stream.read()
+                    except serial.SerialException as e:
+                        print(f"Device {stream.device_id} disconnected: {e}")
+                        selector.unregister(key.fileobj)
+                        stream.close()
+                        continue
+                    pending.add(stream.device_id)
+
+                now = time.time()
+                if now - last_emit >= self.chunk_interval:
+                    last_emit = now
+                    for device in pending:
+                        if self.on_chunk is not None:
+                            self.on_chunk(device)
+                    pending.clear()
+        finally:
+            self.running = False
+            selector.close()
+            for stream in self.streams.values():
+                stream.close()
+            for device in pending:
+                if self.on_chunk is not None:
+                    self.on_chunk(device)
+
+    def stop(self):
+        self.running = False
+
+    def metrics(self):
+        return {device: stream.metrics() for device, stream in self.streams.items()}
+
+
+class MultiDeviceReader(QThread):
+    chunk_ready = Signal(str)
+
+    def __init__(self, ports=None, chunk_interval=CHUNK_INTERVAL, duration=None):
+        super().__init__()
+        self.multiplexer = DeviceMultiplexer(ports, chunk_interval, on_chunk=self.chunk_ready.emit)
+        self.duration = duration
+
+    def run(self):
+        self.multiplexer.run(self.duration)
+
+    def stop(self):
+        self.multiplexer.stop()
+
+
+class MultiDeviceRecorder(QObject):
+    # Records one subject per device; every device gets its own recording file
+    # and optionally its own StreamingSignalProcessor
+    def __init__(self, ports=None):
+        super().__init__()
+        self.reader = MultiDeviceReader(ports)
+        self.reader.chunk_ready.connect(self.record_chunk)
+        self.writers = {}
+        self.processors = {}
+
+    @property
+    def devices(self):
+        return list(self.reader.multiplexer.streams)
+
+    @Slot(str)
+    def record_chunk(self, device):
+        samples = self.reader.multiplexer.streams[device].buffer.read()
+        if samples.shape[1] == 0:
+            return
+        if device in self.writers:
+            self.writers[device].write(samples)
+        if device in self.processors:
+            self.processors[device].update(samples)
+
+    def start_recording(self, path_template, processor_factory=None):
+        # path_template is formatted with the device id, e.g. "recording_{device}_<time>.ldr"
+        self.writers = {
+            device: RecordingWriter(path_template.format(device=device), metadata={"device": device})
+            for device in self.devices
+        }
+        self.processors = {device: processor_factory() for device in self.devices} if processor_factory else {}
+        self.reader.start()
+
+    def stop_recording_and_save(self):
+        self.reader.stop()
+        self.reader.wait()
+        metrics = self.reader.multiplexer.metrics()
+        for device in self.devices:
+            self.record_chunk(device)
+        paths = {}
+        for device, writer in self.writers.items():
+            writer.close(**metrics[device])
+            paths[device] = writer.path
+            print(f"Recording of {device} saved to {writer.path} ({writer.num_samples} samples)")
+        self.writers = {}
+        return paths
+
+    def metrics(self):
+        return self.reader.multiplexer.metrics()
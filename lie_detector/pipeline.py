@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from PySide6.QtCore import QObject, Signal
+
+from lie_detector.constants import PIPELINE_MAX_PENDING, PIPELINE_WORKERS
+from lie_detector.instrumentation import count, metrics, span
+
+
+@dataclass
+class AnswerJob:
+    # Everything needed to turn an answered question window into a prediction,
+    # captured when the answer is given so the next question can reuse the recorder
+    question: str
+    answer: str
+    raw_recording_path: str
+    start_time: float  # Feature window within the recording, in seconds
+    end_time: float
+    processor: Any = None  # StreamingSignalProcessor that already has the features
+    recorded_at: str = ""  # Start time in the file names, the key in the session store
+    sequence: int = -1
+    submitted: float = 0.0
+
+
+@dataclass
+class AnswerResult:
+    job: AnswerJob
+    features_path: Optional[str] = None
+    prediction: Optional[float] = None  # None while the model is not ready
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+
+class AnswerPipeline(QObject):
+    # Processes answered question windows on a pool of worker threads while the
+    # next question is being recorded. process(job) returns the path of the
+    # features file and predict(path) the prediction for it (or None).
+    #
+    # Backpressure: at most max_pending jobs are unfinished at a time; the
+    # caller checks saturated before starting another question and submit()
+    # raises queue.Full past the limit. Ordering: result_ready is emitted once
+    # per job in submission order, a window that finishes early is held back
+    # until the ones before it are done. With no workers the job runs inside
+    # submit(), on the caller's thread.
+    result_ready = Signal(object)
+
+    def __init__(self, process, predict, workers=PIPELINE_WORKERS, max_pending=PIPELINE_MAX_PENDING):
+        super().__init__()
+        self.process = process
+        self.predict = predict
+        self.max_pending = max(1, max_pending)
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        # Held while results are emitted so two workers cannot interleave them
+        self.emit_lock = threading.Lock()
+        self.next_sequence = 0
+        self.next_result = 0
+        self.finished = {}  # sequence -> AnswerResult waiting for earlier ones
+        self.threads = [
+            threading.Thread(target=self.run, name=f"AnswerPipeline-{i}", daemon=True) for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    @property
+    def pending(self):
+        with self.lock:
+            return self.next_sequence - self.next_result
+
+    @property
+    def saturated(self):
+        return self.pending >= self.max_pending
+
+    def submit(self, job):
+        with self.lock:
+            if self.next_sequence - self.next_result >= self.max_pending:
+                raise queue.Full(f"{self.max_pending} answers are already being processed")
+            job.sequence = self.next_sequence
+            job.submitted = time.perf_counter()
+            self.next_sequence += 1
+        count("pipeline_jobs")
+        if self.threads:
+            self.jobs.put(job)
+        else:
+            self.finish(self.execute(job))
+        return job.sequence
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            self.finish(self.execute(job))
+
+    def execute(self, job):
+        started = time.perf_counter()
+        metrics.observe("pipeline.queue_wait", started - job.submitted)
+        result = AnswerResult(job)
+        try:
+            with span("pipeline.process"):
+                result.features_path = self.process(job)
+            with span("pipeline.predict"):
+                result.prediction = self.predict(result.features_path)
+        except Exception as e:
+            count("pipeline_errors")
+            result.error = f"{type(e).__name__}: {e}"
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def finish(self, result):
+        with self.emit_lock:
+            with self.lock:
+                self.finished[result.job.sequence] = result
+                ready = []
+                while self.next_result in self.finished:
+                    ready.append(self.finished.pop(self.next_result))
+                    self.next_result += 1
+            for result in ready:
+                self.result_ready.emit(result)
+
+    def close(self):
+        # Lets the queued jobs finish, their results are still emitted
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
@@ -0,0 +1,85 @@
+import json
+import os
+
+import numpy as np
+
+INDEX_FILENAME = "index.json"
+FEATURES_FILENAME = "X.npy"
+LABELS_FILENAME = "y.npy"
+ANSWER_FORMAT = 2  # Bump when the labels are read differently from the answer files
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def entry_signature(data_path, answer):
+    # answer is the answer file, or the label itself when it comes from the session store
+    if isinstance(answer, str):
+        return file_signature(data_path) + file_signature(answer) + [ANSWER_FORMAT]
+    return file_signature(data_path) + [answer]
+
+
+class DatasetCache:
+    # Keeps the assembled X/y arrays on disk. Each row is tied to the signatures
+    # (mtime, size) of the processed recording and answer file it came from, so a
+    # reload only parses recordings that are new or changed since the last one.
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        self.features_path = os.path.join(cache_dir, FEATURES_FILENAME)
+        self.labels_path = os.path.join(cache_dir, LABELS_FILENAME)
+
+    def load_index(self):
+        if not (os.path.exists(self.index_path) and os.path.exists(self.features_path)):
+            return {}, None, None
+        with open(self.index_path) as f:
+            entries = json.load(f)
+        X = np.load(self.features_path, mmap_mode="r")
+        y = np.load(self.labels_path)
+        return entries, X, y
+
+    def load(self, pairs, parse):
+        # pairs: (key, data_path, answer); parse(data_path, answer) -> (features, label)
+        cached_entries, cached_X, cached_y = self.load_index()
+
+        entries = {}
+        rows = []
+        labels = []
+        parsed = 0
+        for key, data_path, answer in pairs:
+            signature = entry_signature(data_path, answer)
+            cached = cached_entries.get(key)
+            if cached is not None and cached["signature"] == signature:
+                rows.append(cached_X[cached["row"]])
+                labels.append(cached_y[cached["row"]])
+            else:
+                features, label = parse(data_path, answer)
+                rows.append(np.asarray(features, dtype=float))
+                labels.append(np.nan if label is None else float(label))
+                parsed += 1
+            entries[key] = {"signature": signature, "row": len(rows) - 1}
+
+        if parsed or entries.keys() != cached_entries.keys():
+            self.save(entries, rows, labels)
+        print(f"Dataset: {len(entries)} recordings, {parsed} parsed, {len(entries) - parsed} from cache")
+
+        X = np.load(self.features_path, mmap_mode="r")
+        y = np.load(self.labels_path)
+        valid = ~np.isnan(y)
+        if valid.all():
+            return X, y.astype(int)
+        return X[valid], y[valid].astype(int)
+
+    def save(self, entries, rows, labels):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        X = np.stack(rows) if rows else np.empty((0,))
+        # Written under temporary names first, the old X.npy may still be mapped
+        np.save(self.features_path + ".tmp.npy", X)
+        np.save(self.labels_path + ".tmp.npy", np.array(labels, dtype=float))
+        with open(self.index_path + ".tmp", "w") as f:
+            json.dump(entries, f)
+        os.replace(self.features_path + ".tmp.npy", self.features_path)
+        os.replace(self.labels_path + ".tmp.npy", self.labels_path)
+        os.replace(self.index_path + ".tmp", self.index_path)
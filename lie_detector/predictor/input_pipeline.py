@@ -0,0 +1,140 @@
+import zlib
+
+import numpy as np
+
+from lie_detector.data_preprocessing.constants import NUM_SAMPLES, WINDOW_LENGTH, WINDOW_STRIDE
+from lie_detector.data_preprocessing.process_signals import FEATURE_COLUMNS
+from lie_detector.data_preprocessing.windows import WindowCache, WindowDataset
+from lie_detector.recording_format import HEADER_SIZE, RECORDING_EXTENSION, read_features
+
+# Streaming tf.data input for training: processed windows are read from disk
+# as the model consumes them instead of being stacked into one array first, so
+# memory stays bounded by the shuffle buffer and the prefetched batches.
+WINDOW_SHAPE = (NUM_SAMPLES, len(FEATURE_COLUMNS))
+SHUFFLE_BUFFER = 256  # Decoded windows shuffled together after the file order is shuffled
+VALIDATION_FRACTION = 0.1
+SPLIT_SEED = 42
+
+
+def recording_id(key):
+    # recording_20240621_124856_output.ldr (directory layout) or 20240621_124856
+    # (session store) -> 20240621_124856
+    if key.startswith("recording_"):
+        parts = key.split("_")
+        return (parts[1] + "_" + parts[2]).split(".")[0]
+    return key
+
+
+def is_validation(key, validation_fraction=VALIDATION_FRACTION, seed=SPLIT_SEED):
+    # Decided by a hash of the recording id alone, so a recording stays on its
+    # side of the split however the archive grows or is listed
+    return zlib.crc32(f"{seed}:{recording_id(key)}".encode()) / 2**32 < validation_fraction
+
+
+def split_records(records, validation_fraction=VALIDATION_FRACTION, seed=SPLIT_SEED):
+    # records: (key, features path, label) -> (train, validation)
+    train, validation = [], []
+    for record in records:
+        (validation if is_validation(record[0], validation_fraction, seed) else train).append(record)
+    return train, validation
+
+
+def read_window(path):
+    # The path arrives as bytes, or a 0-d array of them when run eagerly
+    return np.asarray(read_features(np.asarray(path).item().decode()), dtype=np.float64)
+
+
+def decode_window(path):
+    import tensorflow as tf
+
+    # .ldr feature files are float64 rows after a header padded to HEADER_SIZE
+    # and are decoded in TensorFlow; CSV files go through read_features
+    def decode_binary():
+        contents = tf.io.read_file(path)
+        rows = tf.io.decode_raw(tf.strings.substr(contents, HEADER_SIZE, -1), tf.float64, little_endian=True)
+        return tf.reshape(rows, WINDOW_SHAPE)
+
+    def decode_csv():
+        window = tf.numpy_function(read_window, [path], tf.float64, stateful=False)
+        return tf.reshape(window, WINDOW_SHAPE)
+
+    window = tf.cond(tf.strings.regex_full_match(path, f".*\\{RECORDING_EXTENSION}"), decode_binary, decode_csv)
+    return tf.cast(window, tf.float32)
+
+
+def make_dataset(records, batch_size=32, training=True, shuffle_buffer=SHUFFLE_BUFFER, seed=SPLIT_SEED):
+    # records: (key, features path, label) with a known label
+    import tensorflow as tf
+
+    paths = [path for _, path, _ in records]
+    labels = np.array([label for _, _, label in records], dtype=np.float32)
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if training:
+        # Only the file names are shuffled in full, the windows in a bounded buffer
+        dataset = dataset.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.map(
+        lambda path, label: (decode_window(path), label),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not training,
+    )
+    if training:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def make_datasets(records, batch_size=32, validation_fraction=VALIDATION_FRACTION, seed=SPLIT_SEED):
+    train, validation = split_records(records, validation_fraction, seed)
+    return (
+        make_dataset(train, batch_size, training=True, seed=seed),
+        make_dataset(validation, batch_size, training=False),
+        len(train),
+        len(validation),
+    )
+
+
+def make_window_dataset(windows, batch_size=32, training=True, shuffle_buffer=SHUFFLE_BUFFER, seed=SPLIT_SEED):
+    # Batches of a WindowDataset. The recordings are visited in a shuffled
+    # order and their windows read one after the other, so consecutive reads
+    # hit the same cached recording; the windows are then mixed in the shuffle buffer.
+    import tensorflow as tf
+
+    def read(index):
+        window, label = windows[int(index)]
+        return window.astype(np.float32), np.float32(label)
+
+    def decode(index):
+        window, label = tf.numpy_function(read, [index], (tf.float32, tf.float32), stateful=False)
+        return tf.ensure_shape(window, (windows.num_samples, len(FEATURE_COLUMNS))), tf.ensure_shape(label, ())
+
+    offsets = tf.constant(windows.offsets, dtype=tf.int64)
+    dataset = tf.data.Dataset.range(len(windows.records))
+    if training:
+        dataset = dataset.shuffle(len(windows.records), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.flat_map(lambda recording: tf.data.Dataset.range(offsets[recording], offsets[recording + 1]))
+    dataset = dataset.map(decode, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not training)
+    if training:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def make_window_datasets(
+    records,
+    batch_size=32,
+    length=WINDOW_LENGTH,
+    stride=WINDOW_STRIDE,
+    cache_dir=None,
+    validation_fraction=VALIDATION_FRACTION,
+    seed=SPLIT_SEED,
+):
+    # Like make_datasets with overlapping windows of whole (raw) recordings,
+    # split by recording so no window of a validation recording is trained on
+    train, validation = split_records(records, validation_fraction, seed)
+    cache = WindowCache(cache_dir)
+    train = WindowDataset(train, length, stride, cache=cache)
+    validation = WindowDataset(validation, length, stride, cache=cache)
+    return (
+        make_window_dataset(train, batch_size, training=True, seed=seed),
+        make_window_dataset(validation, batch_size, training=False),
+        len(train),
+        len(validation),
+    )
@@ -0,0 +1,65 @@
+import argparse
+
+import numpy as np
+from scipy.special import expit
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": expit,
+}
+
+
+def export_weights(model, path):
+    # Freezes the Dense layers of a trained Keras model (Flatten has no weights)
+    # into an .npz file the NumPy engine can load without TensorFlow
+    arrays = {}
+    activations = []
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue
+        kernel, bias = weights
+        arrays[f"kernel_{len(activations)}"] = kernel.astype(np.float32)
+        arrays[f"bias_{len(activations)}"] = bias.astype(np.float32)
+        activations.append(layer.get_config()["activation"])
+    np.savez(path, activations=np.array(activations), input_shape=np.array(model.input_shape[1:]), **arrays)
+    return path
+
+
+class NumpyLieDetector:
+    # Forward pass of the Flatten -> Dense stack in NumPy
+    def __init__(self, path):
+        with np.load(path) as weights:
+            self.input_shape = tuple(int(d) for d in weights["input_shape"])
+            activations = [str(a) for a in weights["activations"]]
+            self.layers = [
+                (weights[f"kernel_{i}"], weights[f"bias_{i}"], ACTIVATIONS[activation])
+                for i, activation in enumerate(activations)
+            ]
+
+    def predict(self, X, verbose=None):
+        X = np.asarray(X, dtype=np.float32)
+        if X.shape == self.input_shape:
+            X = X[np.newaxis]
+        outputs = X.reshape(len(X), -1)
+        for kernel, bias, activation in self.layers:
+            outputs = activation(outputs @ kernel + bias)
+        return outputs
+
+
+def compare_with_keras(model, path, X):
+    # Largest difference between the Keras model and its exported NumPy engine
+    return np.max(np.abs(NumpyLieDetector(path).predict(X) - model.predict(X, verbose=0)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a trained model for TensorFlow-free inference")
+    parser.add_argument("model_path")
+    parser.add_argument("output_path")
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    export_weights(tf.keras.models.load_model(args.model_path), args.output_path)
+    print(f"Saved inference weights to {args.output_path}")
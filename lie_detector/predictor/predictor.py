@@ -1,43 +1,118 @@
+import csv
 import os
 import pandas as pd
 import numpy as np
-import tensorflow as tf
+
+from lie_detector.instrumentation import count, timed
+from lie_detector.predictor.dataset_cache import DatasetCache
+from lie_detector.predictor.numpy_backend import NumpyLieDetector, export_weights
+from lie_detector.recording_format import read_features
+
+PROCESSED_SUFFIXES = ("_output.csv", "_output.ldr")
+RAW_SUFFIXES = (".csv", ".ldr")
+TRUTH_LABELS = {"Truth": 1, "Lie": 0}
+HIDDEN_LAYERS = (128, 64)  # Units of the Dense layers between Flatten and the output
 
 class LieDetectorModel:
-    def __init__(self, data_directory, answers_directory):
+    def __init__(
+        self, data_directory, answers_directory, cache_dir=None, session_store=None, recordings_directory=None
+    ):
         self.data_directory = data_directory
         self.answers_directory = answers_directory
+        # Raw recordings, for training on windows of the whole recording
+        self.recordings_directory = recordings_directory
+        self.cache_dir = cache_dir
+        # SessionStore to take the recordings and labels from instead of the directories
+        self.session_store = session_store
+        self.model = None
+        # NumPy engine used for predictions when loaded
+        self.inference_model = None
     
     def extract_timestamp(self, filename):
         parts = filename.split("_")
         timestamp = parts[1] + "_" + parts[2]
         return timestamp.split(".")[0]  
-    
-    def load_data(self):
-        data_files = os.listdir(self.data_directory)
-        answer_files = os.listdir(self.answers_directory)
 
-        data_list = []
-        labels = []
+    def recording_pairs(self, raw=False):
+        # Matches every processed (or raw) recording with its answer file through
+        # a timestamp -> answer file index instead of scanning all answer files.
+        # From a session store the pairs are (key, data path, label).
+        if self.session_store is not None:
+            return self.session_store.training_pairs(raw=raw)
+
+        answer_index = {}
+        for answer_file in os.listdir(self.answers_directory):
+            if answer_file.startswith("answers_"):
+                answer_index.setdefault(self.extract_timestamp(answer_file), answer_file)
 
-        for data_file in data_files:
-            timestamp = self.extract_timestamp(data_file)
-            answer_file = next((af for af in answer_files if timestamp in af), None)
+        pairs = []
+        directory = self.recordings_directory if raw else self.data_directory
+        for data_file in sorted(os.listdir(directory)):
+            if raw:
+                if not data_file.startswith("recording_") or not data_file.endswith(RAW_SUFFIXES):
+                    continue
+                if data_file.endswith(PROCESSED_SUFFIXES):
+                    continue
+            elif not data_file.endswith(PROCESSED_SUFFIXES):
+                continue
+            answer_file = answer_index.get(self.extract_timestamp(data_file))
             if not answer_file:
                 continue
+            pairs.append(
+                (
+                    data_file,
+                    os.path.join(directory, data_file),
+                    os.path.join(self.answers_directory, answer_file),
+                )
+            )
+        return pairs
 
-            data_path = os.path.join(self.data_directory, data_file)
-            data_df = pd.read_csv(data_path)
+    def read_label(self, answer_path):
+        if not isinstance(answer_path, str):
+            return answer_path  # Already the label
+        # Only the first row matters, read without pandas since this runs once per recording
+        with open(answer_path, newline="") as f:
+            rows = csv.reader(f)
+            row = next(rows, [])
+            # Files created by the first save_answer of a directory have a header
+            if row[:1] == ["question"]:
+                row = next(rows, [])
+        return TRUTH_LABELS.get(row[2] if len(row) > 2 else None, np.nan)
 
-            answer_path = os.path.join(self.answers_directory, answer_file)
-            answer_df = pd.read_csv(answer_path, header=None, names=["Question", "Answer", "Truth"])
+    def labelled_recordings(self, raw=False):
+        # (key, data path, label) for the recordings with a truth label; only the
+        # labels are read, the features stay on disk
+        records = []
+        for key, data_path, answer_path in self.recording_pairs(raw):
+            label = self.read_label(answer_path)
+            if label is not None and not pd.isna(label):
+                records.append((key, data_path, int(label)))
+        return records
 
-            truth_value = answer_df["Truth"].map({"Truth": 1, "Lie": 0}).values[0]
+    @timed("load_data")
+    def load_data(self):
+        data_list = []
+        labels = []
 
-            data_list.append(data_df)
-            labels.append(truth_value)
+        for _, data_path, answer_path in self.recording_pairs():
+            data_list.append(read_features(data_path))
+            labels.append(self.read_label(answer_path))
 
         return data_list, labels
+
+    @timed("load_dataset")
+    def load_dataset(self):
+        # X and y ready for training; with a cache directory only new or changed
+        # recordings are parsed
+        if self.cache_dir is None:
+            data, labels = self.load_data()
+            return self.preprocess_data(data, labels)
+
+        def parse(data_path, answer_path):
+            label = self.read_label(answer_path)
+            return read_features(data_path), None if pd.isna(label) else label
+
+        return DatasetCache(self.cache_dir).load(self.recording_pairs(), parse)
     
     def preprocess_data(self, data, labels):
         new_data = []
@@ -48,26 +123,51 @@ class LieDetectorModel:
                 new_data.append(data[i])
                 new_labels.append(labels[i])
 
-        X = np.array([data_df.to_numpy() for data_df in new_data])
+        X = np.array([np.asarray(data_df) for data_df in new_data])
         y = np.array(new_labels)
         return X, y 
     
-    def build_model(self, shape):
+    def build_model(self, shape, layers=HIDDEN_LAYERS):
+        import tensorflow as tf
+
         model = tf.keras.Sequential(
-            [
-                tf.keras.layers.Flatten(input_shape=shape), 
-                tf.keras.layers.Dense(128, activation="relu"),
-                tf.keras.layers.Dense(64, activation="relu"),
-                tf.keras.layers.Dense(1, activation="sigmoid"),
-            ]
+            [tf.keras.layers.Flatten(input_shape=shape)]
+            + [tf.keras.layers.Dense(units, activation="relu") for units in layers]
+            + [tf.keras.layers.Dense(1, activation="sigmoid")]
         )
         model.compile(optimizer="adam", loss="binary_crossentropy", metrics=["accuracy"])
         return model
     
-    def train_model(self, X_train, y_train, X_test, y_test, epochs=10, batch_size=32):
-        self.model = self.build_model(X_train.shape[1:])
-        self.model.fit(X_train, y_train, epochs=epochs, batch_size=batch_size, validation_data=(X_test, y_test))
+    @timed("train_model")
+    def train_model(
+        self,
+        X_train,
+        y_train,
+        X_test,
+        y_test,
+        epochs=10,
+        batch_size=32,
+        callbacks=None,
+        layers=HIDDEN_LAYERS,
+        verbose="auto",
+    ):
+        self.model = self.build_model(X_train.shape[1:], layers)
+        self.model.fit(
+            X_train,
+            y_train,
+            epochs=epochs,
+            batch_size=batch_size,
+            validation_data=(X_test, y_test),
+            callbacks=callbacks,
+            verbose=verbose,
+        )
     
+    @timed("train_model")
+    def train_dataset(self, train, validation, epochs=10, callbacks=None):
+        # Same model, fitted on tf.data datasets of (window, label) batches
+        self.model = self.build_model(tuple(train.element_spec[0].shape[1:]))
+        self.model.fit(train, epochs=epochs, validation_data=validation, callbacks=callbacks)
+
     def evaluate_model(self, X_test, y_test):
         loss, accuracy = self.model.evaluate(X_test, y_test)
         print(f"Test Accuracy: {accuracy}")
@@ -76,10 +176,36 @@ class LieDetectorModel:
         self.model.save(path)
     
     def load_model(self, path):
+        import tensorflow as tf
+
         self.model = tf.keras.models.load_model(path)
     
+    def export_inference_weights(self, path):
+        export_weights(self.model, path)
+
+    def load_inference_weights(self, path):
+        self.inference_model = NumpyLieDetector(path)
+
     def predict(self, X):
         X = np.expand_dims(X, axis=0) 
         print(X.shape[0], X.shape[1])
-        return self.model.predict(X)
-    
\ No newline at end of file
+        return self.predict_batch(X)
+
+    @timed("predict")
+    def predict_batch(self, X):
+        model = self.inference_model if self.inference_model is not None else self.model
+        count("predictions", len(X))
+        return model.predict(X)
+
+
+def epoch_progress_callback(report):
+    # Keras callback calling report(message) after every training epoch
+    import tensorflow as tf
+
+    class EpochProgress(tf.keras.callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            accuracy = (logs or {}).get("accuracy")
+            message = f"Training model: epoch {epoch + 1}/{self.params['epochs']}"
+            report(message if accuracy is None else f"{message}, accuracy {accuracy:.2f}")
+
+    return EpochProgress()
@@ -0,0 +1,207 @@
+import argparse
+import json
+import queue
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from lie_detector.data_preprocessing.constants import END_TIME, NUM_SAMPLES, START_TIME
+from lie_detector.data_preprocessing.process_signals import (
+    FEATURE_COLUMNS,
+    features_from_signals,
+    signals_from_samples,
+)
+from lie_detector.predictor.predictor import LieDetectorModel
+
+DEFAULT_PORT = 8765
+WINDOW_SHAPE = (NUM_SAMPLES, len(FEATURE_COLUMNS))
+
+
+class MicroBatcher:
+    # Coalesces concurrent prediction requests: the first waiting window opens a
+    # batch which is run once it is full or max_delay seconds have passed
+    def __init__(self, predict_batch, max_batch_size=32, max_delay=0.01):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.request_count = 0
+        self.batch_count = 0
+        self.latencies = []
+        self.thread = threading.Thread(target=self.run, name="MicroBatcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, window):
+        future = Future()
+        self.requests.put((np.asarray(window, dtype=np.float32), future, time.perf_counter()))
+        return future
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            # The first request has been waiting since it was submitted, not dequeued
+            deadline = batch[0][2] + self.max_delay
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                predictions = self.predict_batch(np.stack([window for window, _, _ in batch]))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            for (_, future, submitted), prediction in zip(batch, predictions):
+                future.set_result(float(np.ravel(prediction)[0]))
+            with self.lock:
+                self.request_count += len(batch)
+                self.batch_count += 1
+                self.latencies.extend(done - submitted for _, _, submitted in batch)
+                del self.latencies[:-10000]
+
+    def stats(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            elapsed = time.time() - self.started
+            stats = {
+                "requests": self.request_count,
+                "batches": self.batch_count,
+                "mean_batch_size": self.request_count / self.batch_count if self.batch_count else 0.0,
+                "throughput_per_second": self.request_count / elapsed if elapsed else 0.0,
+            }
+        if len(latencies):
+            stats.update(
+                {
+                    "latency_ms_p50": float(np.percentile(latencies, 50)),
+                    "latency_ms_p95": float(np.percentile(latencies, 95)),
+                    "latency_ms_max": float(latencies.max()),
+                }
+            )
+        return stats
+
+
+def features_from_raw(samples, start_time=START_TIME, end_time=END_TIME):
+    # samples: raw rows of timestamp, red, ir, gsr as sent by the recorder. The
+    # same stages and working rate as process_signal, which the model is trained on
+    samples = np.asarray(samples, dtype=np.int64).T
+    return features_from_signals(signals_from_samples(samples, start_time, end_time))
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, self.server.batcher.stats())
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self.send_json(404, {"error": "Not found"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if "raw" in request:
+                window = features_from_raw(
+                    request["raw"], request.get("start_time", START_TIME), request.get("end_time", END_TIME)
+                )
+            else:
+                window = np.asarray(request["window"], dtype=np.float32)
+            # A malformed window would otherwise fail the whole batch it lands in
+            if np.shape(window) != WINDOW_SHAPE:
+                raise ValueError(f"Expected a window of shape {WINDOW_SHAPE}, got {np.shape(window)}")
+            prediction = self.server.batcher.submit(window).result()
+        except (KeyError, ValueError, IndexError) as e:
+            self.send_json(400, {"error": f"{type(e).__name__}: {e}"})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self.send_json(200, {"prediction": prediction, "label": "Lie" if prediction < 0.5 else "Truth"})
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PredictionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batcher):
+        super().__init__(address, PredictionRequestHandler)
+        self.batcher = batcher
+
+
+class PredictionClient:
+    # Used by the GUI instead of an in-process model
+    def __init__(self, url, timeout=10):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def post(self, payload):
+        request = urllib.request.Request(
+            self.url + "/predict", json.dumps(payload).encode(), {"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def predict(self, window):
+        return self.post({"window": np.asarray(window).tolist()})["prediction"]
+
+    def predict_raw(self, samples, start_time=START_TIME, end_time=END_TIME):
+        payload = {"raw": np.asarray(samples).tolist(), "start_time": start_time, "end_time": end_time}
+        return self.post(payload)["prediction"]
+
+    def stats(self):
+        with urllib.request.urlopen(self.url + "/stats", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve lie detector predictions to recording stations")
+    parser.add_argument("model_path", help="Keras model, or .npz weights exported for NumPy inference")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-delay-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    lie_detector = LieDetectorModel(None, None)
+    if args.model_path.endswith(".npz"):
+        lie_detector.load_inference_weights(args.model_path)
+    else:
+        lie_detector.load_model(args.model_path)
+
+    batcher = MicroBatcher(lie_detector.predict_batch, args.max_batch_size, args.max_delay_ms / 1000)
+    server = PredictionServer((args.host, args.port), batcher)
+    print(f"Serving predictions on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(batcher.stats()))
+
+
+if __name__ == "__main__":
+    main()
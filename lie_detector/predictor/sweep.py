@@ -0,0 +1,312 @@
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from lie_detector.constants import ANSWERS_DIR, DATASET_CACHE_DIR, RECORDINGS_PROCESSED_DIR, SESSION_DB_PATH
+from lie_detector.predictor.predictor import HIDDEN_LAYERS, LieDetectorModel
+
+# k-fold cross-validation of a hyperparameter grid (hidden layer sizes, epochs,
+# batch size). Every (configuration, fold) trial is a task in a pool of worker
+# processes, each capped at a number of threads. The dataset is loaded once,
+# saved next to the results and memory-mapped by every worker. Finished trials
+# are appended to results.jsonl keyed by their configuration, fold and the
+# dataset, so running an interrupted sweep again only runs the missing trials.
+# The configuration with the best mean validation accuracy over all its folds
+# is then refit on the whole dataset and saved with its NumPy inference weights.
+RESULTS_FILENAME = "results.jsonl"
+TABLE_FILENAME = "results.csv"
+BEST_FILENAME = "best.json"
+BEST_MODEL_FILENAME = "best_model.keras"
+FEATURES_FILENAME = "X.npy"
+LABELS_FILENAME = "y.npy"
+THREAD_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+    "TF_NUM_INTEROP_THREADS",
+)
+
+# The dataset as mapped in a worker process
+_X = None
+_y = None
+
+
+def config_name(config):
+    return f"{'-'.join(str(units) for units in config['layers'])}/e{config['epochs']}/b{config['batch_size']}"
+
+
+def make_grid(layers, epochs, batch_sizes):
+    return [
+        {"layers": list(units), "epochs": n_epochs, "batch_size": batch_size}
+        for units, n_epochs, batch_size in itertools.product(layers, epochs, batch_sizes)
+    ]
+
+
+def dataset_hash(X, y):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X).tobytes())
+    digest.update(np.asarray(y).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def trial_key(config, fold, folds, seed, dataset):
+    key = dict(config, fold=fold, folds=folds, seed=seed, dataset=dataset)
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def fold_assignment(y, folds, seed):
+    # Stratified: every class is shuffled and dealt out over the folds in turn
+    rng = np.random.default_rng(seed)
+    assignment = np.empty(len(y), dtype=int)
+    offset = 0
+    for label in np.unique(y):
+        members = rng.permutation(np.flatnonzero(y == label))
+        assignment[members] = (offset + np.arange(len(members))) % folds
+        offset += len(members)
+    return assignment
+
+
+def init_worker(features_path, labels_path, threads):
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+    global _X, _y
+    _X = np.load(features_path, mmap_mode="r")
+    _y = np.load(labels_path)
+
+
+def run_trial(trial):
+    import tensorflow as tf
+
+    started = time.perf_counter()
+    tf.keras.utils.set_random_seed(trial["seed"] + trial["fold"])
+    validation = fold_assignment(_y, trial["folds"], trial["seed"]) == trial["fold"]
+    X_train, y_train = _X[~validation], _y[~validation]
+    X_validation, y_validation = _X[validation], _y[validation]
+
+    lie_detector = LieDetectorModel(None, None)
+    lie_detector.train_model(
+        X_train,
+        y_train,
+        X_validation,
+        y_validation,
+        epochs=trial["epochs"],
+        batch_size=trial["batch_size"],
+        layers=trial["layers"],
+        verbose=0,
+    )
+    loss, accuracy = lie_detector.model.evaluate(X_validation, y_validation, verbose=0)
+    return dict(
+        trial,
+        loss=float(loss),
+        accuracy=float(accuracy),
+        train_accuracy=float(lie_detector.model.history.history["accuracy"][-1]),
+        seconds=time.perf_counter() - started,
+    )
+
+
+def refit(config, seed, model_path):
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    lie_detector = LieDetectorModel(None, None)
+    lie_detector.model = lie_detector.build_model(_X.shape[1:], config["layers"])
+    lie_detector.model.fit(np.asarray(_X), _y, epochs=config["epochs"], batch_size=config["batch_size"], verbose=0)
+    lie_detector.save_model(model_path)
+    lie_detector.export_inference_weights(os.path.splitext(model_path)[0] + ".npz")
+    return model_path
+
+
+def load_results(path):
+    results = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                # The last line may be cut off when a run was killed while writing it
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                results[row["key"]] = row
+    return results
+
+
+def load_best(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def results_table(rows):
+    # One row per configuration, the best first
+    table = (
+        pd.DataFrame(rows)
+        .groupby("config")
+        .agg(
+            folds=("fold", "count"),
+            accuracy=("accuracy", "mean"),
+            accuracy_std=("accuracy", "std"),
+            loss=("loss", "mean"),
+            train_accuracy=("train_accuracy", "mean"),
+            seconds=("seconds", "sum"),
+        )
+        .fillna(0.0)
+    )
+    return table.sort_values(["accuracy", "loss"], ascending=[False, True])
+
+
+def run_trials(executor, trials, results, results_path, report=print):
+    # Appends every finished trial to results_path as soon as it is done
+    with open(results_path, "a") as f:
+        futures = {executor.submit(run_trial, trial): trial for trial in trials}
+        for future in as_completed(futures):
+            trial = futures[future]
+            progress = f"{trial['config']} fold {trial['fold'] + 1}/{trial['folds']}"
+            try:
+                row = future.result()
+            except Exception as e:
+                # Not recorded, the next run retries it
+                report(f"{progress} failed: {type(e).__name__}: {e}")
+                continue
+            f.write(json.dumps(row) + "\n")
+            f.flush()
+            results[row["key"]] = row
+            report(f"{progress}: accuracy {row['accuracy']:.3f}, loss {row['loss']:.3f} ({row['seconds']:.1f} s)")
+
+
+def save_best(executor, table, grid, folds, seed, dataset, output_dir, report=print):
+    # Refits the best configuration with all its folds done, unless the saved
+    # model already is that configuration fitted on this dataset
+    complete = table[table["folds"] == folds]
+    if complete.empty:
+        report("No configuration has all its folds yet, run the sweep again to finish it")
+        return None
+    name = complete.index[0]
+    best = {
+        "config": next(config for config in grid if config_name(config) == name),
+        "accuracy": float(complete.loc[name, "accuracy"]),
+        "loss": float(complete.loc[name, "loss"]),
+        "dataset": dataset,
+        "seed": seed,
+        "model": os.path.join(output_dir, BEST_MODEL_FILENAME),
+    }
+    best_path = os.path.join(output_dir, BEST_FILENAME)
+    previous = load_best(best_path)
+    fitted = previous is not None and all(previous[field] == best[field] for field in ("config", "dataset", "seed"))
+    if not (fitted and os.path.exists(best["model"])):
+        report(f"Refitting {name} on the whole dataset...")
+        executor.submit(refit, best["config"], seed, best["model"]).result()
+        with open(best_path + ".tmp", "w") as f:
+            json.dump(best, f, indent=1)
+        os.replace(best_path + ".tmp", best_path)
+    report(f"Best: {name}, accuracy {best['accuracy']:.3f}, saved to {best['model']}")
+    return best
+
+
+def run_sweep(X, y, output_dir, grid, folds=5, seed=42, workers=None, threads=1, report=print):
+    os.makedirs(output_dir, exist_ok=True)
+    features_path = os.path.join(output_dir, FEATURES_FILENAME)
+    labels_path = os.path.join(output_dir, LABELS_FILENAME)
+    np.save(features_path, np.asarray(X, dtype=np.float64))
+    np.save(labels_path, np.asarray(y))
+    dataset = dataset_hash(X, y)
+
+    trials = [
+        dict(
+            config,
+            config=config_name(config),
+            fold=fold,
+            folds=folds,
+            seed=seed,
+            dataset=dataset,
+            key=trial_key(config, fold, folds, seed, dataset),
+        )
+        for config in grid
+        for fold in range(folds)
+    ]
+    results_path = os.path.join(output_dir, RESULTS_FILENAME)
+    results = load_results(results_path)
+    pending = [trial for trial in trials if trial["key"] not in results]
+    workers = workers or max(1, (os.cpu_count() or 1) // threads)
+    report(f"{len(y)} recordings, {len(trials)} trials, {len(trials) - len(pending)} already done, {workers} workers")
+
+    # Spawned workers inherit the environment, so the thread caps are in place
+    # before they import NumPy or TensorFlow (which must not be forked either)
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(threads)
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(features_path, labels_path, threads),
+    )
+    try:
+        run_trials(executor, pending, results, results_path, report)
+        rows = [results[trial["key"]] for trial in trials if trial["key"] in results]
+        best = None
+        if rows:
+            table = results_table(rows)
+            table.to_csv(os.path.join(output_dir, TABLE_FILENAME))
+            report(table.to_string(float_format=lambda value: f"{value:.3f}"))
+            best = save_best(executor, table, grid, folds, seed, dataset, output_dir, report)
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-validate a grid of model hyperparameters in parallel")
+    parser.add_argument("output_dir", help="Results, the shared dataset and the best model; rerun to resume")
+    parser.add_argument("--processed", default=RECORDINGS_PROCESSED_DIR, help="Processed recordings")
+    parser.add_argument("--answers", default=ANSWERS_DIR)
+    parser.add_argument("--db", default=SESSION_DB_PATH, help="Session store to take the recordings from instead")
+    parser.add_argument("--cache-dir", default=DATASET_CACHE_DIR)
+    parser.add_argument(
+        "--layers",
+        nargs="+",
+        default=[",".join(str(units) for units in HIDDEN_LAYERS)],
+        help="Hidden layer sizes to try, e.g. 128,64 256,128,64",
+    )
+    parser.add_argument("--epochs", type=int, nargs="+", default=[10])
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[32])
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count / threads)")
+    parser.add_argument("--threads", type=int, default=1, help="Threads per worker process")
+    args = parser.parse_args()
+
+    store = None
+    if args.db:
+        from lie_detector.session_store import SessionStore
+
+        store = SessionStore(args.db)
+    lie_detector = LieDetectorModel(args.processed, args.answers, args.cache_dir, session_store=store)
+    X, y = lie_detector.load_dataset()
+    if store is not None:
+        store.close()
+    if len(y) < args.folds:
+        parser.error(f"{len(y)} labelled recordings are not enough for {args.folds} folds")
+
+    layers = [[int(units) for units in sizes.split(",")] for sizes in args.layers]
+    grid = make_grid(layers, args.epochs, args.batch_size)
+    try:
+        run_sweep(X, y, args.output_dir, grid, args.folds, args.seed, args.workers, args.threads)
+    except KeyboardInterrupt:
+        print(f"Interrupted, run again to resume from {os.path.join(args.output_dir, RESULTS_FILENAME)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import glob
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+from lie_detector.instrumentation import count
+
+# Binary recording file (.ldr):
+#   magic (6 bytes) | header length (uint32 LE) | JSON header, space padded | rows
+# The rows are a little-endian row-major (n, columns) array, so a file can be
+# appended to chunk by chunk and mapped into memory as a whole. The header holds
+# the column names, dtype and sampling metadata and is padded to HEADER_SIZE so
+# it can be rewritten with the final statistics when the writer is closed.
+MAGIC = b"LDREC\x01"
+HEADER_SIZE = 1024
+RECORDING_EXTENSION = ".ldr"
+
+RAW_COLUMNS = ["timestamp", "red", "ir", "gsr"]
+RAW_DTYPE = "<i8"
+
+
+def is_binary_recording(path):
+    return path.endswith(RECORDING_EXTENSION)
+
+
+def encode_header(header):
+    payload = json.dumps(header).encode()
+    size = len(MAGIC) + 4 + len(payload)
+    if size > HEADER_SIZE:
+        raise ValueError(f"Recording header too large ({size} > {HEADER_SIZE} bytes)")
+    payload += b" " * (HEADER_SIZE - size)
+    return MAGIC + struct.pack("<I", len(payload)) + payload
+
+
+def read_header(f):
+    magic = f.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError(f"{getattr(f, 'name', 'file')} is not a binary recording")
+    (length,) = struct.unpack("<I", f.read(4))
+    header = json.loads(f.read(length))
+    header["data_offset"] = len(MAGIC) + 4 + length
+    return header
+
+
+class RecordingWriter:
+    # Appends columnar (columns, n) chunks to a binary recording without keeping
+    # them in memory
+    def __init__(self, path, columns=RAW_COLUMNS, dtype=RAW_DTYPE, metadata=None):
+        self.path = path
+        self.header = {"columns": list(columns), "dtype": np.dtype(dtype).str, "metadata": metadata or {}}
+        self.dtype = np.dtype(dtype)
+        self.num_samples = 0
+        self.file = open(path, "wb")
+        self.file.write(encode_header(self.header))
+
+    def write(self, samples):
+        rows = np.ascontiguousarray(np.asarray(samples).T, dtype=self.dtype)
+        if rows.ndim != 2 or rows.shape[1] != len(self.header["columns"]):
+            raise ValueError(f"Expected {len(self.header['columns'])} columns, got array of shape {np.shape(samples)}")
+        self.file.write(rows.tobytes())
+        self.num_samples += len(rows)
+        count("bytes_written", rows.nbytes)
+
+    def close(self, **metadata):
+        if self.file.closed:
+            return
+        self.header["metadata"].update(metadata)
+        self.header["metadata"]["num_samples"] = self.num_samples
+        self.file.seek(0)
+        self.file.write(encode_header(self.header))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_recording(path, samples, columns=RAW_COLUMNS, dtype=RAW_DTYPE, metadata=None):
+    with RecordingWriter(path, columns, dtype, metadata) as writer:
+        writer.write(samples)
+    return path
+
+
+def read_recording(path, mmap=True):
+    # Returns the (columns, n) array as a view of the file and the header
+    with open(path, "rb") as f:
+        header = read_header(f)
+        dtype = np.dtype(header["dtype"])
+        num_columns = len(header["columns"])
+        row_size = dtype.itemsize * num_columns
+        num_samples = (os.fstat(f.fileno()).st_size - header["data_offset"]) // row_size
+        if mmap:
+            if num_samples == 0:
+                return np.empty((num_columns, 0), dtype=dtype), header
+            rows = np.memmap(f, dtype=dtype, mode="r", offset=header["data_offset"], shape=(num_samples, num_columns))
+        else:
+            rows = np.fromfile(f, dtype=dtype, count=num_samples * num_columns).reshape(num_samples, num_columns)
+    return rows.T, header
+
+
+def read_samples(path):
+    # Raw (4, n) samples from either a binary recording or a headerless CSV
+    if is_binary_recording(path):
+        return read_recording(path)[0]
+    return pd.read_csv(path, header=None).to_numpy().T
+
+
+def read_features(path):
+    # Processed (90, 7) feature matrix from either a binary or a CSV file
+    if is_binary_recording(path):
+        return read_recording(path)[0].T
+    return pd.read_csv(path).to_numpy()
+
+
+def convert_csv(csv_path, output_path):
+    with open(csv_path) as f:
+        first_line = f.readline()
+    has_header = any(c.isalpha() for c in first_line)
+    if has_header:
+        df = pd.read_csv(csv_path)
+        write_recording(output_path, df.to_numpy(dtype=float).T, columns=list(df.columns), dtype="<f8")
+    else:
+        samples = pd.read_csv(csv_path, header=None).to_numpy().T
+        write_recording(output_path, samples, metadata={"converted_from": os.path.basename(csv_path)})
+    return output_path
+
+
+def convert_archive(root_dir, output_dir):
+    # Converts raw and processed CSV recordings, keeping the directory layout.
+    # Answer files stay CSV.
+    converted = []
+    for csv_path in glob.glob(os.path.join(root_dir, "**/*.csv"), recursive=True):
+        name = os.path.basename(csv_path)
+        if not name.startswith("recording_"):
+            continue
+        relative = os.path.relpath(csv_path, root_dir)
+        output_path = os.path.join(output_dir, os.path.splitext(relative)[0] + RECORDING_EXTENSION)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        try:
+            converted.append(convert_csv(csv_path, output_path))
+            print(f"Converted {csv_path}")
+        except Exception as e:
+            print(f"Error converting {csv_path}: {e}")
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert CSV recordings to the binary recording format")
+    parser.add_argument("root_dir")
+    parser.add_argument("output_dir")
+    args = parser.parse_args()
+    convert_archive(args.root_dir, args.output_dir)
@@ -0,0 +1,185 @@
+import re
+import threading
+
+import numpy as np
+
+SAMPLE_COLUMNS = ("timestamp", "red", "ir", "gsr")
+SAMPLE_DTYPE = np.int64
+
+# One "millis,red,ir,gsr" line as printed by arduino/arduino.ino
+LINE_PATTERN = re.compile(rb"^(\d+),(\d+),(\d+),(\d+)\r?$", re.MULTILINE)
+NONBLANK_LINE = re.compile(rb"[^\r\n][^\n]*\n")
+
+
+def empty_samples():
+    return np.empty((len(SAMPLE_COLUMNS), 0), dtype=SAMPLE_DTYPE)
+
+
+class SampleParser:
+    # Parses raw serial bytes into columnar (4, n) sample arrays, keeping any
+    # incomplete trailing line until the next feed.
+    def __init__(self):
+        self.pending = b""
+        self.parse_errors = 0
+        self.samples_parsed = 0
+
+    def feed(self, data):
+        data = self.pending + data
+        end = data.rfind(b"\n")
+        if end < 0:
+            self.pending = data
+            return empty_samples()
+        self.pending = data[end + 1 :]
+        complete = data[: end + 1]
+
+        matches = LINE_PATTERN.findall(complete)
+        self.parse_errors += len(NONBLANK_LINE.findall(complete)) - len(matches)
+        if not matches:
+            return empty_samples()
+
+        samples = np.array(matches).astype(SAMPLE_DTYPE).T
+        self.samples_parsed += samples.shape[1]
+        return samples
+
+    def reset(self):
+        self.pending = b""
+
+
+# Binary frame sent by arduino/arduino.ino with BINARY_PROTOCOL enabled. The sync
+# word reads A5 5A on the wire, the checksum is the low byte of the sum of the
+# bytes between the sync word and the checksum.
+FRAME_DTYPE = np.dtype(
+    [
+        ("sync", "<u2"),
+        ("sequence", "<u2"),
+        ("timestamp", "<u4"),
+        ("red", "<u4"),
+        ("ir", "<u4"),
+        ("gsr", "<u2"),
+        ("checksum", "u1"),
+    ]
+)
+FRAME_SIZE = FRAME_DTYPE.itemsize
+SYNC_BYTES = (0xA5, 0x5A)
+
+
+class FrameParser:
+    # Decodes whole read buffers of binary frames at once. Corrupted or partial
+    # frames are skipped by resynchronizing on the next sync word with a valid
+    # checksum, and frames lost on the way are counted from sequence gaps.
+    def __init__(self):
+        self.pending = b""
+        self.parse_errors = 0
+        self.samples_parsed = 0
+        self.lost_frames = 0
+        self.last_sequence = None
+
+    def feed(self, data):
+        buffer = np.frombuffer(self.pending + data, dtype=np.uint8)
+        candidates = np.flatnonzero((buffer[:-1] == SYNC_BYTES[0]) & (buffer[1:] == SYNC_BYTES[1]))
+        complete = candidates[candidates + FRAME_SIZE <= len(buffer)]
+
+        frame_bytes = buffer[complete[:, np.newaxis] + np.arange(FRAME_SIZE)]
+        valid = (frame_bytes[:, 2:-1].sum(axis=1, dtype=np.uint32) & 0xFF) == frame_bytes[:, -1]
+        positions = complete[valid]
+        frame_bytes = frame_bytes[valid]
+        if np.any(np.diff(positions) < FRAME_SIZE):
+            # A sync word with a matching checksum inside another frame, rare
+            # enough to resolve in Python
+            keep = np.zeros(len(positions), dtype=bool)
+            end = -1
+            for i, position in enumerate(positions):
+                if position >= end:
+                    keep[i] = True
+                    end = position + FRAME_SIZE
+            positions = positions[keep]
+            frame_bytes = frame_bytes[keep]
+
+        # Keep the incomplete frame at the end, if any, for the next feed
+        consumed = positions[-1] + FRAME_SIZE if len(positions) else 0
+        incomplete = candidates[(candidates + FRAME_SIZE > len(buffer)) & (candidates >= consumed)]
+        if len(incomplete):
+            tail = incomplete[0]
+        elif len(buffer) and buffer[-1] == SYNC_BYTES[0]:
+            tail = len(buffer) - 1
+        else:
+            tail = len(buffer)
+        self.pending = buffer[max(tail, consumed) :].tobytes()
+
+        # Every stretch of skipped bytes is one resynchronization
+        expected = np.concatenate([[0], positions[:-1] + FRAME_SIZE])
+        self.parse_errors += int(np.count_nonzero(positions != expected)) + int(tail > consumed)
+        if len(positions) == 0:
+            return empty_samples()
+
+        frames = frame_bytes.reshape(-1).view(FRAME_DTYPE)
+        sequence = frames["sequence"].astype(np.int64)
+        previous = sequence[:1] - 1 if self.last_sequence is None else [self.last_sequence]
+        gaps = np.diff(np.concatenate([previous, sequence])) % 65536
+        self.lost_frames += int(np.maximum(gaps - 1, 0).sum())
+        self.last_sequence = int(sequence[-1])
+
+        samples = np.vstack([frames["timestamp"], frames["red"], frames["ir"], frames["gsr"]]).astype(SAMPLE_DTYPE)
+        self.samples_parsed += samples.shape[1]
+        return samples
+
+    def reset(self):
+        self.pending = b""
+        self.last_sequence = None
+
+
+PARSERS = {"ascii": SampleParser, "binary": FrameParser}
+
+
+class SampleBuffer:
+    # Preallocated columnar ring buffer shared between the reader thread (writer)
+    # and the consumer. Unread samples that get overwritten are counted as dropped.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros((len(SAMPLE_COLUMNS), capacity), dtype=SAMPLE_DTYPE)
+        self.written = 0
+        self.consumed = 0
+        self.dropped_samples = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return self.written - self.consumed
+
+    def write(self, samples):
+        n = samples.shape[1]
+        if n == 0:
+            return
+        with self.lock:
+            if n > self.capacity:
+                # The oldest samples of the write are never stored, they are
+                # dropped here and must not count as overwritten below as well
+                self.dropped_samples += n - self.capacity
+                self.written += n - self.capacity
+                self.consumed += n - self.capacity
+                samples = samples[:, -self.capacity :]
+                n = self.capacity
+
+            start = self.written % self.capacity
+            first = min(n, self.capacity - start)
+            self.data[:, start : start + first] = samples[:, :first]
+            self.data[:, : n - first] = samples[:, first:]
+            self.written += n
+
+            overflow = self.written - self.consumed - self.capacity
+            if overflow > 0:
+                self.dropped_samples += overflow
+                self.consumed += overflow
+
+    def read(self):
+        with self.lock:
+            n = self.written - self.consumed
+            start = self.consumed % self.capacity
+            indices = (start + np.arange(n)) % self.capacity
+            samples = self.data[:, indices]
+            self.consumed += n
+        return samples
+
+    def clear(self):
+        with self.lock:
+            self.consumed = self.written
@@ -0,0 +1,291 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from lie_detector.constants import (
+    ANSWERS_DIR,
+    QUESTIONS_PATH,
+    RECORDINGS_DIR,
+    RECORDINGS_PROCESSED_DIR,
+    SESSION_DB_PATH,
+)
+
+# Recordings, answers and their file names are tied together by recorded_at,
+# the %Y%m%d_%H%M%S start time in recording_<recorded_at>.ldr and
+# answers_<recorded_at>.csv
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    metadata TEXT
+);
+CREATE TABLE IF NOT EXISTS answers (
+    recorded_at TEXT PRIMARY KEY,
+    session_id INTEGER REFERENCES sessions(id),
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    truth INTEGER  -- 1 for the truth, 0 for a lie, NULL when not answered
+);
+CREATE INDEX IF NOT EXISTS answers_session ON answers(session_id, recorded_at);
+CREATE TABLE IF NOT EXISTS recordings (
+    recorded_at TEXT PRIMARY KEY,
+    session_id INTEGER REFERENCES sessions(id),
+    raw_path TEXT,
+    features_path TEXT,
+    num_samples INTEGER,
+    sampling_frequency REAL,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS recordings_session ON recordings(session_id, recorded_at);
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    recorded_at TEXT NOT NULL,
+    predicted_at REAL NOT NULL,
+    prediction REAL NOT NULL,
+    model TEXT
+);
+CREATE INDEX IF NOT EXISTS predictions_recorded_at ON predictions(recorded_at, predicted_at);
+"""
+
+TRUTH_LABELS = {"Truth": 1, "Lie": 0}
+FLUSH_WRITES = 64  # Buffered writes that trigger a commit
+FLUSH_SECONDS = 5.0  # Age of the oldest buffered write that triggers a commit
+
+
+class SessionStore:
+    # Append-only SQLite store (WAL mode) for the question bank, answers, truth
+    # labels, recordings and predictions. Writes are buffered and committed in
+    # one transaction once FLUSH_WRITES have accumulated or the oldest is
+    # FLUSH_SECONDS old (checked by a background thread, so the last writes of a
+    # session do not wait for the next one), on flush() and on close(); reads
+    # flush first. Safe to use from several threads.
+    def __init__(self, path=SESSION_DB_PATH, flush_writes=FLUSH_WRITES, flush_seconds=FLUSH_SECONDS):
+        self.path = path
+        self.flush_writes = flush_writes
+        self.flush_seconds = flush_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Durable at every checkpoint, a power cut can only lose the last commits
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.pending = []
+        self.pending_since = None
+        self.questions = None
+        self.closed = threading.Event()
+        self.flusher = threading.Thread(target=self.flush_when_due, name="SessionStoreFlush", daemon=True)
+        self.flusher.start()
+
+    def write(self, sql, parameters=()):
+        with self.lock:
+            if not self.pending:
+                self.pending_since = time.monotonic()
+            self.pending.append((sql, parameters))
+            due = len(self.pending) >= self.flush_writes or time.monotonic() - self.pending_since >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+            if pending:
+                with self.connection:
+                    for sql, parameters in pending:
+                        self.connection.execute(sql, parameters)
+
+    def flush_when_due(self):
+        while True:
+            # Until the oldest buffered write is due, or a full period when there is none
+            with self.lock:
+                wait = self.flush_seconds
+                if self.pending:
+                    wait = self.pending_since + self.flush_seconds - time.monotonic()
+            if self.closed.wait(max(wait, 0)):
+                return
+            with self.lock:
+                due = self.pending and time.monotonic() - self.pending_since >= self.flush_seconds
+            if due:
+                self.flush()
+
+    def query(self, sql, parameters=()):
+        self.flush()
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def close(self):
+        self.closed.set()
+        self.flusher.join()
+        self.flush()
+        with self.lock:
+            self.connection.close()
+
+    def question_bank(self, questions_path=QUESTIONS_PATH):
+        # Loaded once; the CSV is imported the first time the bank is empty
+        if self.questions is None:
+            if questions_path and not self.query("SELECT 1 FROM questions LIMIT 1"):
+                self.import_questions(questions_path)
+            self.questions = [text for (text,) in self.query("SELECT text FROM questions ORDER BY id")]
+        return self.questions
+
+    def import_questions(self, questions_path):
+        questions = pd.read_csv(questions_path, delimiter=";")["question"].astype(str)
+        for text in questions:
+            self.write("INSERT OR IGNORE INTO questions (text) VALUES (?)", (text,))
+        self.flush()
+        self.questions = None
+        return len(questions)
+
+    def start_session(self, **metadata):
+        # Committed straight away, the answers refer to its id
+        self.flush()
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO sessions (started_at, metadata) VALUES (?, ?)", (time.time(), json.dumps(metadata))
+            )
+        return cursor.lastrowid
+
+    def save_answer(self, recorded_at, question, answer, truth=None, session_id=None):
+        # truth: "Truth"/"Lie" as in the answer files, a bool, or None when not answered
+        if isinstance(truth, str):
+            truth = TRUTH_LABELS.get(truth)
+        self.write(
+            "INSERT OR REPLACE INTO answers (recorded_at, session_id, question, answer, truth) VALUES (?, ?, ?, ?, ?)",
+            (recorded_at, session_id, question, answer, None if truth is None else int(truth)),
+        )
+
+    def save_recording(self, recorded_at, raw_path=None, features_path=None, session_id=None, metadata=None):
+        metadata = metadata or {}
+        self.write(
+            "INSERT INTO recordings "
+            "(recorded_at, session_id, raw_path, features_path, num_samples, sampling_frequency, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (recorded_at) DO UPDATE SET "
+            "session_id = coalesce(excluded.session_id, session_id), "
+            "raw_path = coalesce(excluded.raw_path, raw_path), "
+            "features_path = coalesce(excluded.features_path, features_path), "
+            "num_samples = coalesce(excluded.num_samples, num_samples), "
+            "sampling_frequency = coalesce(excluded.sampling_frequency, sampling_frequency), "
+            "metadata = coalesce(excluded.metadata, metadata)",
+            (
+                recorded_at,
+                session_id,
+                raw_path,
+                features_path,
+                metadata.get("num_samples"),
+                metadata.get("sampling_frequency"),
+                json.dumps(metadata) if metadata else None,
+            ),
+        )
+
+    def save_prediction(self, recorded_at, prediction, model=None):
+        self.write(
+            "INSERT INTO predictions (recorded_at, predicted_at, prediction, model) VALUES (?, ?, ?, ?)",
+            (recorded_at, time.time(), float(prediction), model),
+        )
+
+    def training_pairs(self, raw=False):
+        # (recorded_at, features path, label) for every processed recording with
+        # an answer, in one indexed join; the label is None when not answered.
+        # With raw, the raw recording paths instead.
+        column = "raw_path" if raw else "features_path"
+        return self.query(
+            f"SELECT r.recorded_at, r.{column}, a.truth FROM recordings r "
+            "JOIN answers a ON a.recorded_at = r.recorded_at "
+            f"WHERE r.{column} IS NOT NULL ORDER BY r.recorded_at"
+        )
+
+    def session_answers(self, session_id):
+        # Answers of a session with their recording and latest prediction
+        return self.query(
+            "SELECT a.recorded_at, a.question, a.answer, a.truth, r.raw_path, r.features_path, "
+            "(SELECT p.prediction FROM predictions p WHERE p.recorded_at = a.recorded_at "
+            "ORDER BY p.predicted_at DESC LIMIT 1) "
+            "FROM answers a LEFT JOIN recordings r ON r.recorded_at = a.recorded_at "
+            "WHERE a.session_id = ? ORDER BY a.recorded_at",
+            (session_id,),
+        )
+
+    def counts(self):
+        return {
+            table: self.query(f"SELECT count(*) FROM {table}")[0][0]
+            for table in ("questions", "sessions", "answers", "recordings", "predictions")
+        }
+
+
+def recorded_at_from_filename(filename):
+    # recording_20240621_124856.ldr, recording_20240621_124856_output.csv and
+    # answers_20240621_124856.csv -> 20240621_124856
+    parts = os.path.basename(filename).split("_")
+    return (parts[1] + "_" + parts[2]).split(".")[0]
+
+
+def import_files(store, answers_dir=None, processed_dir=None, recordings_dir=None):
+    # Imports the answers_<time>.csv files and registers the raw and processed
+    # recordings next to them. Safe to run again, rows are keyed by recorded_at.
+    imported = {"answers": 0, "recordings": 0, "features": 0}
+    if answers_dir:
+        for filename in sorted(os.listdir(answers_dir)):
+            if not (filename.startswith("answers_") and filename.endswith(".csv")):
+                continue
+            with open(os.path.join(answers_dir, filename), newline="") as f:
+                # Files created by the first save_answer of a directory have a header
+                rows = [row for row in csv.reader(f) if len(row) == 3 and row[0] != "question"]
+            if not rows:
+                continue
+            question, answer, truth = rows[0]
+            store.save_answer(recorded_at_from_filename(filename), question, answer, truth or None)
+            imported["answers"] += 1
+    for directory, column in ((recordings_dir, "raw_path"), (processed_dir, "features_path")):
+        if not directory:
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if not filename.startswith("recording_"):
+                continue
+            is_features = os.path.splitext(filename)[0].endswith("_output")
+            if is_features != (column == "features_path"):
+                continue
+            store.save_recording(recorded_at_from_filename(filename), **{column: os.path.join(directory, filename)})
+            imported["features" if is_features else "recordings"] += 1
+    store.flush()
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session store for questions, answers, recordings and predictions")
+    parser.add_argument("--db", default=SESSION_DB_PATH, help="SQLite database (SESSION_DB_PATH)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Import the question bank, answer files and recordings")
+    import_parser.add_argument("--questions", default=QUESTIONS_PATH)
+    import_parser.add_argument("--answers", default=ANSWERS_DIR)
+    import_parser.add_argument("--processed", default=RECORDINGS_PROCESSED_DIR)
+    import_parser.add_argument("--recordings", default=RECORDINGS_DIR)
+
+    subparsers.add_parser("stats", help="Row counts")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("--db or SESSION_DB_PATH is required")
+
+    store = SessionStore(args.db)
+    if args.command == "import":
+        if args.questions:
+            print(f"{store.import_questions(args.questions)} questions")
+        print(json.dumps(import_files(store, args.answers, args.processed, args.recordings)))
+    print(json.dumps(store.counts()))
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import pty
+import threading
+import time
+import tty
+
+import numpy as np
+from PySide6.QtCore import QCoreApplication
+
+from lie_detector.connect import BatchArduinoReader
+from lie_detector.constants import CHUNK_INTERVAL, SERIAL_PROTOCOL
+from lie_detector.data_preprocessing.utils import RESET_JUMP_MS
+from lie_detector.recording_format import read_samples
+from lie_detector.synthetic import encode_frames, encode_lines, synthesize_samples
+
+ENCODERS = {"ascii": encode_lines, "binary": encode_frames}
+
+
+def impair(samples, noise=0.0, glitch_rate=0.0, seed=0):
+    # Sensor noise on red/IR/GSR and timestamp glitches: a glitched sample
+    # either repeats the previous timestamp or jumps back up to a second
+    rng = np.random.default_rng(seed)
+    samples = np.array(samples, dtype=np.int64)
+    if noise:
+        samples[1:] += np.rint(rng.normal(0, noise, samples[1:].shape)).astype(np.int64)
+        np.maximum(samples[1:], 0, out=samples[1:])
+    if glitch_rate:
+        glitched = np.flatnonzero(rng.random(samples.shape[1] - 1) < glitch_rate) + 1
+        repeat = rng.random(len(glitched)) < 0.5
+        samples[0, glitched[repeat]] = samples[0, glitched[repeat] - 1]
+        jumps = glitched[~repeat]
+        samples[0, jumps] = np.maximum(samples[0, jumps] - rng.integers(1, 1000, len(jumps)), 0)
+    return samples
+
+
+class VirtualSerialDevice:
+    # Streams samples through a pseudo terminal (POSIX only) in the wire format
+    # of arduino/arduino.ino, paced by the sample timestamps. port can be opened
+    # by anything that takes a serial port: ArduinoReader, DataRecorder,
+    # MainWindowApp (through SERIAL_PORT) or the multi-device reader.
+    def __init__(
+        self,
+        samples,
+        speed=1.0,
+        protocol=SERIAL_PROTOCOL,
+        noise=0.0,
+        drop_rate=0.0,
+        glitch_rate=0.0,
+        write_interval=0.01,
+        seed=0,
+    ):
+        # speed: multiple of real time, None sends as fast as the reader takes it
+        self.samples = np.asarray(samples)
+        self.speed = speed
+        self.protocol = protocol
+        self.encode = ENCODERS[protocol]
+        self.noise = noise
+        self.drop_rate = drop_rate
+        self.glitch_rate = glitch_rate
+        self.write_interval = write_interval
+        self.rng = np.random.default_rng(seed)
+        self.seed = seed
+        self.master = None
+        self.slave = None
+        self.port = None
+        self.thread = None
+        self.running = False
+        self.started_at = None
+        self.finished_at = None
+        self.bytes_sent = 0
+        self.bytes_dropped = 0
+        self.samples_sent = 0
+        # Wall clock send time of every sample, for latency measurements
+        self.send_times = np.full(self.samples.shape[1], np.nan)
+
+    @classmethod
+    def replay(cls, path, **kwargs):
+        return cls(read_samples(path), **kwargs)
+
+    @classmethod
+    def synthetic(cls, seconds, sampling_frequency=400, seed=0, **kwargs):
+        samples = synthesize_samples(seconds, sampling_frequency, seed=seed, reconnect_samples=0)
+        return cls(samples, seed=seed, **kwargs)
+
+    def open(self):
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        return self.port
+
+    def start(self):
+        if self.port is None:
+            self.open()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="VirtualSerialDevice", daemon=True)
+        self.thread.start()
+        return self.port
+
+    def run(self):
+        wire_samples = impair(self.samples, self.noise, self.glitch_rate, self.seed)
+        # Paced by the clean timestamps, glitches only affect what is sent. Steps
+        # back (board resets, glitches, wraparounds) take no time and forward jumps
+        # are capped, so archived recordings with reset leftovers are sent whole
+        steps = np.clip(np.diff(self.samples[0].astype(np.int64)), 0, RESET_JUMP_MS)
+        schedule = np.concatenate([[0], np.cumsum(steps)]) / 1000
+        if self.speed:
+            schedule = schedule / self.speed
+        boundaries = np.searchsorted(schedule, np.arange(0, schedule[-1] + self.write_interval, self.write_interval))
+        boundaries = np.unique(np.append(boundaries, len(schedule)))
+
+        self.started_at = time.perf_counter()
+        start = 0
+        for end in boundaries[1:]:
+            if not self.running:
+                break
+            if self.speed:
+                delay = self.started_at + schedule[start] - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self.send(wire_samples[:, start:end], start)
+            start = end
+        self.finished_at = time.perf_counter()
+        self.running = False
+
+    def send(self, samples, first_index):
+        data = self.encode(samples, first_index) if self.protocol == "binary" else self.encode(samples)
+        if self.drop_rate:
+            kept = np.frombuffer(data, dtype=np.uint8)[self.rng.random(len(data)) >= self.drop_rate]
+            self.bytes_dropped += len(data) - len(kept)
+            data = kept.tobytes()
+        self.send_times[first_index : first_index + samples.shape[1]] = time.perf_counter()
+        view = memoryview(data)
+        while view and self.running:
+            # Blocks while the pty buffer is full, i.e. when the reader falls behind
+            view = view[os.write(self.master, view) :]
+        self.bytes_sent += len(data)
+        self.samples_sent += samples.shape[1]
+
+    def wait(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def stop(self):
+        self.running = False
+        self.wait()
+
+    def close(self):
+        self.stop()
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = self.port = None
+
+
+def measure_ingest(device, chunk_interval=CHUNK_INTERVAL, drain_time=1.0):
+    # Runs a BatchArduinoReader against the device and reports how much of the
+    # stream arrived, how fast, and how long samples took from the pty to the
+    # consumer. Latency is matched by timestamp and skips glitched samples.
+    port = device.open()
+    reader = BatchArduinoReader(port, chunk_interval=chunk_interval, duration=None, protocol=device.protocol)
+    reader.start()
+    time.sleep(0.2)  # Let the reader open the port before the first byte is sent
+    device.start()
+
+    clean_timestamps, first_index = np.unique(device.samples[0], return_index=True)
+    received = 0
+    latencies = []
+    idle_since = None
+    while True:
+        time.sleep(chunk_interval)
+        samples = reader.buffer.read()
+        now = time.perf_counter()
+        received += samples.shape[1]
+        if samples.shape[1]:
+            positions = np.clip(np.searchsorted(clean_timestamps, samples[0]), 0, len(clean_timestamps) - 1)
+            matched = clean_timestamps[positions] == samples[0]
+            send_times = device.send_times[first_index[positions[matched]]]
+            latencies.append(now - send_times[~np.isnan(send_times)])
+            idle_since = None
+        elif not device.running:
+            idle_since = idle_since or now
+            if now - idle_since >= drain_time:
+                break
+
+    reader.stop()
+    reader.wait()
+    device.close()
+
+    elapsed = device.finished_at - device.started_at
+    latencies = np.concatenate(latencies) * 1000 if latencies else np.empty(0)
+    report = {
+        "protocol": device.protocol,
+        "speed": device.speed,
+        "samples_sent": device.samples_sent,
+        "samples_received": received,
+        "received_ratio": received / device.samples_sent if device.samples_sent else 0.0,
+        "bytes_sent": device.bytes_sent,
+        "bytes_dropped": device.bytes_dropped,
+        "send_seconds": elapsed,
+        "samples_per_second": received / elapsed if elapsed else 0.0,
+        "parse_errors": reader.parse_errors,
+        "dropped_samples": reader.dropped_samples,
+        "lost_frames": reader.lost_frames,
+    }
+    if len(latencies):
+        report.update(
+            {
+                "latency_ms_p50": float(np.percentile(latencies, 50)),
+                "latency_ms_p95": float(np.percentile(latencies, 95)),
+                "latency_ms_max": float(latencies.max()),
+            }
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated Arduino on a pseudo terminal")
+    parser.add_argument("command", choices=["serve", "ingest"], help="serve a port, or measure ingest through it")
+    parser.add_argument("--replay", help="Raw recording to replay instead of a synthetic signal")
+    parser.add_argument("--seconds", type=float, default=60, help="Length of the synthetic signal")
+    parser.add_argument("--sampling-frequency", type=float, default=400)
+    parser.add_argument(
+        "--speed", type=float, nargs="+", default=[1.0], help="Multiples of real time, 0 for as fast as possible"
+    )
+    parser.add_argument("--protocol", choices=sorted(ENCODERS), default=SERIAL_PROTOCOL)
+    parser.add_argument("--noise", type=float, default=0.0, help="Standard deviation added to red/IR/GSR")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Probability of dropping each byte")
+    parser.add_argument("--glitch-rate", type=float, default=0.0, help="Probability of a bad timestamp per sample")
+    parser.add_argument("--output", help="JSON file for the ingest reports")
+    args = parser.parse_args()
+
+    def make_device(speed):
+        options = {
+            "speed": speed or None,
+            "protocol": args.protocol,
+            "noise": args.noise,
+            "drop_rate": args.drop_rate,
+            "glitch_rate": args.glitch_rate,
+        }
+        if args.replay:
+            return VirtualSerialDevice.replay(args.replay, **options)
+        return VirtualSerialDevice.synthetic(args.seconds, args.sampling_frequency, **options)
+
+    if args.command == "serve":
+        device = make_device(args.speed[0])
+        print(f"Serving on {device.open()}, e.g. SERIAL_PORT={device.port} python -m lie_detector")
+        device.start()
+        try:
+            device.wait()
+        except KeyboardInterrupt:
+            pass
+        device.close()
+        return
+
+    # The readers are QThreads
+    if QCoreApplication.instance() is None:
+        QCoreApplication([])
+    reports = []
+    for speed in args.speed:
+        report = measure_ingest(make_device(speed))
+        reports.append(report)
+        print(json.dumps(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import io
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from lie_detector.constants import SECONDS_RECORDING
+from lie_detector.data_preprocessing.constants import NUM_SAMPLES
+from lie_detector.data_preprocessing.process_signals import FEATURE_COLUMNS
+from lie_detector.recording_format import write_recording
+from lie_detector.samples import FRAME_DTYPE, FRAME_SIZE, SAMPLE_COLUMNS, SAMPLE_DTYPE
+
+# Synthetic sensor data shaped like real recordings, for benchmarks and for
+# exercising the recorder without an Arduino
+RED_LEVEL = 250000
+IR_LEVEL = 195000
+GSR_LEVEL = 500
+
+
+def synthesize_samples(
+    seconds=SECONDS_RECORDING,
+    sampling_frequency=400,
+    heart_rate=72,
+    start_ms=5000,
+    seed=0,
+    reconnect_samples=2,
+):
+    # Raw (4, n) samples: a pulse riding on a slow drift for red/IR, a slow GSR
+    # wave, and a few leftover samples from before the board reset at the start
+    rng = np.random.default_rng(seed)
+    t = np.arange(0, seconds, 1 / sampling_frequency)
+    beat_frequency = heart_rate / 60 * (1 + 0.08 * np.sin(2 * np.pi * 0.1 * t))
+    phase = 2 * np.pi * np.cumsum(beat_frequency) / sampling_frequency
+    pulse = np.sin(phase) + 0.4 * np.sin(2 * phase + 0.5)
+
+    red = RED_LEVEL + 200 * t + 300 * pulse + rng.normal(0, 10, len(t))
+    ir = IR_LEVEL + 150 * t + 250 * np.roll(pulse, 3) + rng.normal(0, 10, len(t))
+    gsr = GSR_LEVEL + 50 * np.sin(2 * np.pi * 0.05 * t + rng.uniform(0, 2 * np.pi)) + rng.normal(0, 2, len(t))
+    timestamps = start_ms + t * 1000 + rng.integers(0, 2, len(t))
+
+    samples = np.vstack([timestamps, red, ir, gsr]).astype(SAMPLE_DTYPE)
+    if reconnect_samples:
+        leftover = np.tile([[start_ms + 90000], [1], [1], [1]], reconnect_samples)
+        leftover[0] += np.arange(reconnect_samples)
+        samples = np.hstack([leftover, samples])
+    return samples
+
+
+def encode_lines(samples):
+    # The "millis,red,ir,gsr" lines as sent over serial
+    buffer = io.BytesIO()
+    np.savetxt(buffer, np.asarray(samples).T, fmt="%d", delimiter=",", newline="\r\n")
+    return buffer.getvalue()
+
+
+def write_raw_csv(path, samples):
+    np.savetxt(path, np.asarray(samples).T, fmt="%d", delimiter=",")
+    return path
+
+
+def synthesize_features(seed=0):
+    # A processed (90, 7) window with plausible value ranges
+    rng = np.random.default_rng(seed)
+    timestamps = np.linspace(2, 11, NUM_SAMPLES)
+    ppg = 100 * np.sin(2 * np.pi * 1.2 * timestamps + rng.uniform(0, 2 * np.pi))
+    return np.column_stack(
+        [
+            timestamps,
+            rng.uniform(0, 1, NUM_SAMPLES),
+            RED_LEVEL + rng.normal(0, 300, NUM_SAMPLES),
+            IR_LEVEL + rng.normal(0, 250, NUM_SAMPLES),
+            ppg,
+            rng.normal(100, 2, NUM_SAMPLES),
+            rng.normal(75, 5, NUM_SAMPLES),
+        ]
+    )
+
+
+def write_dataset(data_dir, answers_dir, count, output_format="ldr", seed=0):
+    # Processed recordings and their answer files, named as MainWindowApp names them
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(answers_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        name = (start + timedelta(seconds=i)).strftime("%Y%m%d_%H%M%S")
+        features = synthesize_features(seed + i)
+        save_path = os.path.join(data_dir, f"recording_{name}_output.{output_format}")
+        if output_format == "csv":
+            np.savetxt(save_path, features, delimiter=",", header=",".join(FEATURE_COLUMNS), comments="")
+        else:
+            write_recording(save_path, features.T, columns=FEATURE_COLUMNS, dtype="<f8")
+        label = "Truth" if rng.random() < 0.5 else "Lie"
+        with open(os.path.join(answers_dir, f"answers_{name}.csv"), "w") as f:
+            f.write(f"Synthetic question {i},Yes,{label}\n")
+
+
+def encode_frames(samples, first_sequence=0):
+    # The binary frames sent with the firmware's BINARY_PROTOCOL
+    samples = np.asarray(samples)
+    frames = np.zeros(samples.shape[1], dtype=FRAME_DTYPE)
+    frames["sync"] = 0x5AA5
+    frames["sequence"] = (first_sequence + np.arange(samples.shape[1])) % 65536
+    for name, column in zip(SAMPLE_COLUMNS, samples):
+        frames[name] = column
+    frame_bytes = frames.view(np.uint8).reshape(-1, FRAME_SIZE)
+    frames["checksum"] = frame_bytes[:, 2:-1].sum(axis=1, dtype=np.uint32) & 0xFF
+    return frames.tobytes()
@@ -0,0 +1,11 @@
+from lie_detector.instrumentation import Metrics
+
+
+def test_empty_path_disables_metrics():
+    # METRICS_PATH= as in .env.example
+    metrics = Metrics("")
+    assert not metrics.enabled
+    with metrics.span("read"):
+        pass
+    metrics.count("samples")
+    metrics.flush()
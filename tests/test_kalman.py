@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from lie_detector.data_preprocessing.kalman import ScalarKalmanFilter, compare_with_pykalman
+from lie_detector.data_preprocessing.utils import kalman_filter
+
+pykalman = pytest.importorskip("pykalman")
+
+
+def pykalman_filter(signal):
+    # pykalman with the defaults kalman_filter used to rely on
+    expected, _ = pykalman.KalmanFilter(initial_state_mean=0, n_dim_obs=1).filter(signal)
+    return expected.flatten()
+
+
+def signal(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / 400
+    return np.sin(2 * np.pi * 1.2 * t) + 0.3 * t + rng.normal(0, 0.2, n)
+
+
+def test_matches_pykalman():
+    x = signal()
+    assert np.allclose(kalman_filter(x), pykalman_filter(x))
+    assert compare_with_pykalman(x) < 1e-9
+
+
+def test_chunked_updates_match_pykalman():
+    x = signal(seed=1)
+    kf = ScalarKalmanFilter()
+    chunks = np.split(x, [1, 2, 7, 64, 65, 500, 1999])
+    filtered = np.concatenate([kf.update(chunk) for chunk in chunks])
+    assert np.allclose(filtered, pykalman_filter(x))
+
+
+def test_2d_input_filters_each_row_like_pykalman():
+    rows = np.stack([signal(seed=seed) for seed in range(3)])
+    filtered = kalman_filter(rows)
+    assert filtered.shape == rows.shape
+    for row, expected in zip(filtered, rows):
+        assert np.allclose(row, pykalman_filter(expected))
+
+
+def test_short_signal_matches_pykalman():
+    x = signal(n=5, seed=2)
+    assert np.allclose(kalman_filter(x), pykalman_filter(x))
@@ -0,0 +1,33 @@
+import numpy as np
+
+from lie_detector.samples import SAMPLE_COLUMNS, SAMPLE_DTYPE, SampleBuffer
+
+
+def samples(start, n):
+    return np.tile(np.arange(start, start + n, dtype=SAMPLE_DTYPE), (len(SAMPLE_COLUMNS), 1))
+
+
+def test_write_larger_than_capacity_drops_each_sample_once():
+    buffer = SampleBuffer(8)
+    buffer.write(samples(0, 10))
+    assert buffer.dropped_samples == 2
+    assert len(buffer) == 8
+    np.testing.assert_array_equal(buffer.read()[0], np.arange(2, 10))
+
+
+def test_write_larger_than_capacity_overwrites_unread_samples():
+    buffer = SampleBuffer(8)
+    buffer.write(samples(0, 3))
+    buffer.write(samples(3, 10))
+    assert buffer.dropped_samples == 5
+    np.testing.assert_array_equal(buffer.read()[0], np.arange(5, 13))
+
+
+def test_wrapping_writes_keep_the_newest_samples():
+    buffer = SampleBuffer(8)
+    buffer.write(samples(0, 5))
+    assert buffer.read().shape[1] == 5
+    buffer.write(samples(5, 6))
+    buffer.write(samples(11, 4))
+    assert buffer.dropped_samples == 2
+    np.testing.assert_array_equal(buffer.read()[0], np.arange(7, 15))
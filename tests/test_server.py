@@ -0,0 +1,27 @@
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from lie_detector.data_preprocessing.process_signals import process_signal
+from lie_detector.predictor.server import MicroBatcher, features_from_raw
+from lie_detector.recording_format import read_features, write_recording
+from lie_detector.synthetic import synthesize_samples
+
+
+def test_features_from_raw_match_process_signal(tmp_path):
+    samples = synthesize_samples(sampling_frequency=400, seed=4)
+    path = write_recording(str(tmp_path / "recording_20240101_000000.ldr"), samples)
+    batch = read_features(process_signal(path, str(tmp_path), feature_cache=None))
+
+    np.testing.assert_allclose(features_from_raw(samples.T.tolist()), batch, rtol=0, atol=1e-9)
+
+
+def test_batch_deadline_counts_from_submission():
+    batcher = MicroBatcher(lambda windows: np.zeros((len(windows), 1)), max_delay=5.0)
+    # A request that has already waited longer than max_delay when it is dequeued runs right away
+    future = Future()
+    started = time.perf_counter()
+    batcher.requests.put((np.zeros(1), future, started - 10.0))
+    assert future.result(timeout=2) == 0.0
+    assert time.perf_counter() - started < 2
@@ -0,0 +1,94 @@
+import sqlite3
+import time
+
+import numpy as np
+
+from lie_detector.data_preprocessing.process_signals import save_features
+from lie_detector.predictor.predictor import LieDetectorModel
+from lie_detector.recording_format import write_recording
+from lie_detector.session_store import SessionStore, import_files, recorded_at_from_filename
+
+
+def answer_count(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT count(*) FROM answers").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_last_write_committed_without_another_write(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path, flush_seconds=0.2)
+    store.save_answer("20240101_000000", "Is the sky blue?", "Yes", "Truth")
+    assert answer_count(path) == 0
+
+    deadline = time.monotonic() + 2
+    while answer_count(path) == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert answer_count(path) == 1
+    store.close()
+
+
+def test_close_commits_and_stops_the_flush_thread(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = SessionStore(path, flush_seconds=60)
+    store.save_answer("20240101_000000", "Is the sky blue?", "Yes", "Truth")
+    store.close()
+    assert not store.flusher.is_alive()
+    assert answer_count(path) == 1
+
+
+def write_archive(root):
+    # The directory layout the recorder writes: answer files with and without the
+    # header of the first save_answer of a directory, raw and processed recordings
+    answers = {
+        "20240101_000000": "Is the sky blue?,Yes,Truth\n",
+        "20240101_000100": "question,answer,Truth\nIs grass red?,Yes,Lie\n",
+        "20240101_000200": "Is water wet?,No answer,\n",
+        "20240101_000300": "question,answer,Truth\nIs fire hot?,Yes,Truth\n",
+    }
+    directories = {name: root / name for name in ("answers", "processed", "recordings")}
+    for directory in directories.values():
+        directory.mkdir()
+    rng = np.random.default_rng(0)
+    for recorded_at, contents in answers.items():
+        (directories["answers"] / f"answers_{recorded_at}.csv").write_text(contents)
+        write_recording(str(directories["recordings"] / f"recording_{recorded_at}.ldr"), np.ones((4, 3)))
+        save_features(rng.normal(size=(90, 7)), str(directories["processed"] / f"recording_{recorded_at}_output.ldr"))
+    # A recording without an answer file is not paired
+    write_recording(str(directories["recordings"] / "recording_20240101_000400.ldr"), np.ones((4, 3)))
+    return {name: str(directory) for name, directory in directories.items()}
+
+
+def directory_pairs(model, raw=False):
+    return {
+        (recorded_at_from_filename(key), path, None if np.isnan(label := model.read_label(answer)) else label)
+        for key, path, answer in model.recording_pairs(raw)
+    }
+
+
+def test_import_files_matches_directory_layout(tmp_path):
+    directories = write_archive(tmp_path)
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    imported = import_files(store, directories["answers"], directories["processed"], directories["recordings"])
+    assert imported == {"answers": 4, "recordings": 5, "features": 4}
+
+    model = LieDetectorModel(
+        directories["processed"], directories["answers"], recordings_directory=directories["recordings"]
+    )
+    for raw in (False, True):
+        assert set(store.training_pairs(raw=raw)) == directory_pairs(model, raw)
+    assert [label for _, _, label in store.training_pairs()] == [1, 0, None, 1]
+
+    X, y = model.load_dataset()
+    X_store, y_store = LieDetectorModel(None, None, session_store=store).load_dataset()
+    np.testing.assert_array_equal(X_store, X)
+    np.testing.assert_array_equal(y_store, y)
+
+    # Keyed by recorded_at, importing again changes nothing
+    counts, pairs = store.counts(), store.training_pairs(raw=True)
+    import_files(store, directories["answers"], directories["processed"], directories["recordings"])
+    assert store.counts() == counts
+    assert store.training_pairs(raw=True) == pairs
+    store.close()
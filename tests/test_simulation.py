@@ -0,0 +1,34 @@
+import pytest
+from PySide6.QtCore import QCoreApplication
+
+from lie_detector.recording_format import write_recording
+from lie_detector.simulation import VirtualSerialDevice, measure_ingest
+from lie_detector.synthetic import synthesize_samples
+
+
+@pytest.fixture(scope="module", autouse=True)
+def app():
+    # The readers are QThreads
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.mark.parametrize("protocol", ["ascii", "binary"])
+def test_replay_sends_archived_recording_whole(tmp_path, protocol):
+    # Archived recordings start with leftovers from before the board reset
+    samples = synthesize_samples(seconds=2, seed=5)
+    path = write_recording(str(tmp_path / "recording_20240101_000000.ldr"), samples)
+
+    report = measure_ingest(VirtualSerialDevice.replay(path, speed=None, protocol=protocol), drain_time=0.3)
+
+    assert report["samples_sent"] == samples.shape[1]
+    assert report["samples_received"] == samples.shape[1]
+
+
+def test_replay_paced_by_sample_time():
+    # The two reset leftovers take no time, the rest is one second at 400 Hz
+    samples = synthesize_samples(seconds=1, seed=6)
+
+    report = measure_ingest(VirtualSerialDevice(samples, speed=4.0), drain_time=0.3)
+
+    assert report["samples_received"] == samples.shape[1]
+    assert report["send_seconds"] == pytest.approx(1 / 4, abs=0.1)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from lie_detector.data_preprocessing.constants import END_TIME, START_TIME
+from lie_detector.data_preprocessing.process_signals import process_signal
+from lie_detector.data_preprocessing.streaming import StreamingSignalProcessor, compare_with_batch
+from lie_detector.recording_format import read_features, write_recording
+from lie_detector.synthetic import synthesize_samples
+
+# Largest deviation from the process_signal output, relative to its column range
+TOLERANCE = 1e-9
+
+
+def stream(samples, chunk_size, **window):
+    processor = StreamingSignalProcessor(**window)
+    for start in range(0, samples.shape[1], chunk_size):
+        processor.update(samples[:, start : start + chunk_size])
+    return processor.features()
+
+
+def relative_deviation(streamed, batch):
+    scale = np.ptp(batch, axis=0)
+    scale[scale == 0] = 1
+    return np.max(np.abs(streamed - batch), axis=0) / scale
+
+
+@pytest.mark.parametrize("sampling_frequency", [100, 400, 1000])
+@pytest.mark.parametrize("chunk_size", [1, 64, 1000])
+def test_streaming_features_match_process_signal(tmp_path, sampling_frequency, chunk_size):
+    # With the leftovers from before the board reset that archived recordings start with
+    samples = synthesize_samples(sampling_frequency=sampling_frequency, seed=sampling_frequency)
+    path = write_recording(str(tmp_path / "recording_20240101_000000.ldr"), samples)
+    batch = read_features(process_signal(path, str(tmp_path), feature_cache=None))
+
+    streamed = stream(samples, chunk_size)
+
+    assert streamed.shape == batch.shape
+    assert relative_deviation(streamed, batch).max() < TOLERANCE
+
+
+def test_streaming_segment_window_matches_process_signal(tmp_path):
+    # Continuous sessions cut the window from the start of the segment
+    samples = synthesize_samples(seconds=10, reconnect_samples=0, seed=3)
+    path = write_recording(str(tmp_path / "recording_20240101_000000.ldr"), samples)
+    window = {"start_time": 0.0, "end_time": END_TIME - START_TIME}
+    batch = read_features(process_signal(path, str(tmp_path), feature_cache=None, **window))
+
+    assert relative_deviation(stream(samples, 37, **window), batch).max() < TOLERANCE
+
+
+def test_compare_with_batch_within_tolerance(tmp_path):
+    path = write_recording(str(tmp_path / "recording.ldr"), synthesize_samples(sampling_frequency=400))
+    assert compare_with_batch(path).max() < TOLERANCE
+
+
+def test_no_samples_in_window():
+    with pytest.raises(ValueError):
+        StreamingSignalProcessor().features()
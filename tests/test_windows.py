@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pytest
+
+from lie_detector.data_preprocessing.constants import END_TIME, START_TIME, WINDOW_LENGTH
+from lie_detector.data_preprocessing.process_signals import process_signal
+from lie_detector.data_preprocessing.windows import (
+    RecordingWindows,
+    WindowCache,
+    WindowDataset,
+    raw_timestamps,
+    window_features,
+)
+from lie_detector.recording_format import read_features, read_samples, write_recording
+from lie_detector.synthetic import synthesize_samples
+
+TOLERANCE = 1e-9
+
+
+@pytest.fixture
+def recording(tmp_path):
+    # 12 s at 400 Hz with the leftovers from before the board reset
+    return write_recording(str(tmp_path / "recording_20240101_000000.ldr"), synthesize_samples(seed=7))
+
+
+def assert_same_features(window, expected):
+    scale = np.ptp(expected, axis=0)
+    scale[scale == 0] = 1
+    assert window.shape == expected.shape
+    assert (np.max(np.abs(window - expected), axis=0) / scale).max() < TOLERANCE
+
+
+def test_window_at_fixed_crop_matches_process_signal(recording, tmp_path):
+    expected = read_features(process_signal(recording, str(tmp_path), feature_cache=None))
+    samples = read_samples(recording)
+
+    assert_same_features(window_features(samples, START_TIME, END_TIME - START_TIME), expected)
+    assert_same_features(WindowCache().get(recording)[0], expected)
+
+
+def test_every_window_is_computed_over_its_own_span(recording, tmp_path):
+    windows = RecordingWindows(raw_timestamps(read_samples(recording)))
+    features = WindowCache().get(recording)
+    assert len(features) == len(windows) == 3
+    for i in (1, len(windows) - 1):
+        start = windows.starts[i]
+        window = {"start_time": start, "end_time": start + WINDOW_LENGTH}
+        expected = np.array(read_features(process_signal(recording, str(tmp_path), feature_cache=None, **window)))
+        expected[:, 0] += START_TIME - start
+        assert_same_features(features[i], expected)
+
+
+def test_cached_windows_are_mapped_from_cache_dir(recording, tmp_path):
+    cache_dir = str(tmp_path / "windows")
+    computed = np.array(WindowCache(cache_dir).get(recording))
+    assert len(os.listdir(cache_dir)) == 1
+
+    cache = WindowCache(cache_dir)
+    assert cache.count_windows(recording) == len(computed)
+    mapped = cache.get(recording)
+    assert isinstance(mapped, np.memmap)
+    np.testing.assert_array_equal(mapped, computed)
+
+    # Another geometry is another entry
+    WindowCache(cache_dir).get(recording, stride=2.0)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_count_matches_computed_windows(recording):
+    cache = WindowCache()
+    assert cache.count_windows(recording, stride=0.5) == len(cache.get(recording, stride=0.5)) == 6
+
+
+def test_window_dataset_indexes_raw_and_processed_recordings(recording, tmp_path):
+    processed = process_signal(recording, str(tmp_path), feature_cache=None)
+    dataset = WindowDataset([("raw", recording, 1.0), ("processed", processed, 0.0)])
+
+    assert len(dataset) == 4
+    assert dataset.shape == (4, 90, 7)
+    np.testing.assert_array_equal(dataset.labels(), [1, 1, 1, 0])
+    window, label = dataset[3]
+    assert label == 0.0
+    np.testing.assert_array_equal(window, read_features(processed))
+    window, label = dataset[0]
+    assert label == 1.0
+    assert_same_features(window, read_features(processed))
+
+
+def test_recording_shorter_than_a_window(tmp_path):
+    path = write_recording(str(tmp_path / "recording_20240101_000001.ldr"), synthesize_samples(seconds=5, seed=8))
+    dataset = WindowDataset([("short", path, 1.0)])
+    assert len(dataset) == 0